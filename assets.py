@@ -0,0 +1,124 @@
+import hashlib
+import io
+import os
+import struct
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pygame
+
+from utils import BASE_IMG_PATH, THREADED, preloaded_images
+
+ASSET_CACHE_DIR = ".asset_cache"
+CACHE_HEADER = struct.Struct("<4sII")
+CACHE_MAGIC = b"HDC1"
+
+
+def image_files(root=BASE_IMG_PATH):
+    paths = []
+    for folder, dirs, files in os.walk(root):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith(".png"):
+                path = os.path.join(folder, name)
+                paths.append(os.path.relpath(path, root).replace(os.sep, "/"))
+    return paths
+
+
+def read_image(path):
+    f = open(BASE_IMG_PATH + path, "rb")
+    data = f.read()
+    f.close()
+    return data
+
+
+def decode_image(path, data, cache_path):
+    # runs on a worker: returns the image's size and its RGB pixels, from the
+    # cache when the file's hash has been seen before
+    if cache_path:
+        try:
+            f = open(cache_path, "rb")
+            cached = f.read()
+            f.close()
+            magic, width, height = CACHE_HEADER.unpack_from(cached)
+            if magic == CACHE_MAGIC:
+                return (width, height), cached[CACHE_HEADER.size :]
+        except (OSError, struct.error):
+            pass
+
+    img = pygame.image.load(io.BytesIO(data), path)
+    size = img.get_size()
+    pixels = pygame.image.tobytes(img, "RGB")
+
+    if cache_path:
+        # the pixels are already decoded, so a failed cache write only costs
+        # the next start a decode
+        tmp_path = None
+        try:
+            folder, name = os.path.split(cache_path)
+            fd, tmp_path = tempfile.mkstemp(".tmp", name + ".", folder)
+            f = os.fdopen(fd, "wb")
+            f.write(CACHE_HEADER.pack(CACHE_MAGIC, size[0], size[1]) + pixels)
+            f.close()
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return size, pixels
+
+
+class AssetLoader:
+    def __init__(self, cache_dir=ASSET_CACHE_DIR, workers=None, progress=None):
+        self.cache_dir = cache_dir if THREADED else None
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self.progress = progress
+
+    def preload(self):
+        # decodes every image under images/ and fills the utils cache, so
+        # load_image/load_images return without touching the disk afterwards
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        images = [path for path in image_files() if path not in preloaded_images]
+        total = len(images)
+        done = 0
+        self.report(done, total)
+
+        # identical files (repeated animation frames) are decoded once and
+        # shared by every path that holds them
+        groups = {}
+        for path in images:
+            data = read_image(path)
+            digest = hashlib.sha1(data).hexdigest()
+            groups.setdefault(digest, (data, []))[1].append(path)
+
+        if not THREADED:
+            for data, paths in groups.values():
+                decoded = decode_image(paths[0], data, None)
+                for path in paths:
+                    self.finish_image(path, decoded)
+                    done += 1
+                    self.report(done, total)
+            return
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            jobs = {}
+            for digest, (data, paths) in groups.items():
+                cache_path = os.path.join(self.cache_dir, digest + ".rgb")
+                jobs[pool.submit(decode_image, paths[0], data, cache_path)] = paths
+            for job in as_completed(jobs):
+                decoded = job.result()
+                for path in jobs[job]:
+                    self.finish_image(path, decoded)
+                    done += 1
+                    self.report(done, total)
+
+    def finish_image(self, path, decoded):
+        # converting needs the display, so it always happens on this thread
+        size, pixels = decoded
+        img = pygame.image.frombytes(pixels, size, "RGB").convert()
+        img.set_colorkey((0, 0, 0))
+        preloaded_images[path] = img
+
+    def report(self, done, total):
+        if self.progress:
+            self.progress(done, total)
@@ -0,0 +1,76 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+
+from utils import THREADED
+
+
+class Audio:
+    # sounds are registered up front but only decoded on first use or by a
+    # background preload; streamed tracks go through pygame.mixer.music and
+    # are never held in memory
+    def __init__(self):
+        self.manifest = {}
+        self.sounds = {}
+        self.pending = {}
+        self.pool = ThreadPoolExecutor(1) if THREADED else None
+
+    def register(self, name, path, volume=1.0, stream=False):
+        self.manifest[name] = (path, volume, stream)
+
+    def sound_entry(self, name):
+        path, volume, stream = self.manifest[name]
+        if stream:
+            raise ValueError(name + " is a streamed track; play it with play_music")
+        return path, volume
+
+    def decode(self, name):
+        path, volume = self.sound_entry(name)
+        sound = pygame.mixer.Sound(path)
+        sound.set_volume(volume)
+        return sound
+
+    def preload(self, names):
+        for name in names:
+            if name in self.sounds or name in self.pending:
+                continue
+            if self.pool:
+                # fail here rather than later in the worker
+                self.sound_entry(name)
+                self.pending[name] = self.pool.submit(self.decode, name)
+            else:
+                self.sounds[name] = self.decode(name)
+
+    def __getitem__(self, name):
+        sound = self.sounds.get(name)
+        if sound is None:
+            if name in self.pending:
+                sound = self.pending.pop(name).result()
+            else:
+                sound = self.decode(name)
+            self.sounds[name] = sound
+        return sound
+
+    def play_music(self, name, loops=-1):
+        path, volume, stream = self.manifest[name]
+        pygame.mixer.music.load(path)
+        pygame.mixer.music.set_volume(volume)
+        pygame.mixer.music.play(loops)
+
+    def memory_report(self):
+        # bytes of decoded sample data per registered asset; 0 until decoded
+        # and always 0 for streamed tracks
+        for name, job in list(self.pending.items()):
+            if job.done():
+                self.sounds[name] = self.pending.pop(name).result()
+        mixer = pygame.mixer.get_init()
+        report = {}
+        for name in self.manifest:
+            sound = self.sounds.get(name)
+            if sound is None or not mixer:
+                report[name] = 0
+                continue
+            frequency, size, channels = mixer
+            samples = int(round(sound.get_length() * frequency))
+            report[name] = samples * channels * abs(size) // 8
+        return report
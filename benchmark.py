@@ -0,0 +1,345 @@
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import pygame
+
+from entities import PhysicsEntity
+from levelfile import LEVEL_EXTENSION
+from machine import Machines
+from main import Game
+from particle import Particles
+from tilemap import Tilemap
+
+MAPS = ["maps/0.json", "maps/1.json", "maps/2.json"]
+SCALES = [1, 10, 100]
+TARGET_ROUND_TIME = 0.05
+QUERY_POINTS = 512
+
+
+def measure(fn, setup=None, number=None, repeat=5):
+    # per-call seconds; setup runs before every round and is not timed
+    if number is None:
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        once = max(time.perf_counter() - start, 1e-7)
+        number = max(1, int(TARGET_ROUND_TIME / once))
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return {
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def tile_bounds(locs):
+    xs = [loc[0] for loc in locs]
+    ys = [loc[1] for loc in locs]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def scaled_map(map_data, factor):
+    # repeats the level in a cols x rows block so it has `factor` times the
+    # tiles, spawners and bottles of the original
+    cols = int(math.sqrt(factor))
+    while factor % cols:
+        cols -= 1
+    rows = factor // cols
+    left, top, right, bottom = tile_bounds(
+        [tile["pos"] for tile in map_data["tilemap"].values()]
+    )
+    span = (right - left + 3, bottom - top + 3)
+    tile_size = map_data["tile_size"]
+
+    tilemap = {}
+    offgrid = []
+    for col in range(cols):
+        for row in range(rows):
+            shift = (col * span[0], row * span[1])
+            for tile in map_data["tilemap"].values():
+                pos = [tile["pos"][0] + shift[0], tile["pos"][1] + shift[1]]
+                tilemap[str(pos[0]) + ";" + str(pos[1])] = {
+                    "type": tile["type"],
+                    "variant": tile["variant"],
+                    "pos": pos,
+                }
+            for tile in map_data["offgrid"]:
+                if tile["type"] == "spawners" and tile["variant"] == 0 and (
+                    col or row
+                ):
+                    continue
+                offgrid.append(
+                    {
+                        "type": tile["type"],
+                        "variant": tile["variant"],
+                        "pos": [
+                            tile["pos"][0] + shift[0] * tile_size,
+                            tile["pos"][1] + shift[1] * tile_size,
+                        ],
+                    }
+                )
+    return {"tilemap": tilemap, "tile_size": tile_size, "offgrid": offgrid}
+
+
+def bench_map(game, path, binary_path):
+    results = {}
+    rng = random.Random(0)
+
+    tilemap = Tilemap(game)
+    results["tilemap.load"] = measure(lambda: tilemap.load(path), repeat=3)
+    tilemap.save(binary_path)
+    results["tilemap.load_binary"] = measure(
+        lambda: tilemap.load(binary_path), repeat=3
+    )
+    tilemap.load(path)
+
+    left, top, right, bottom = tile_bounds(tilemap.tilemap)
+    ts = tilemap.tile_size
+    points = [
+        (
+            rng.uniform(left * ts, (right + 1) * ts),
+            rng.uniform(top * ts, (bottom + 1) * ts),
+        )
+        for _ in range(QUERY_POINTS)
+    ]
+
+    def queries(fn):
+        def run():
+            for point in points:
+                fn(point)
+
+        return run
+
+    results["tilemap.tiles_around"] = measure(queries(tilemap.tiles_around))
+    results["tilemap.physics_rects_around"] = measure(
+        queries(tilemap.physics_rects_around)
+    )
+    results["tilemap.solid_check"] = measure(queries(tilemap.solid_check))
+
+    for name in results:
+        if name.startswith("tilemap.") and not name.startswith("tilemap.load"):
+            results[name]["per_query"] = results[name]["median"] / QUERY_POINTS
+
+    results["tilemap.autotile"] = measure(tilemap.autotile, repeat=3)
+    results["tilemap.extract"] = measure(
+        lambda: tilemap.extract([("spawners", 0), ("spawners", 1), ("water", 0)]),
+        setup=lambda: tilemap.load(path),
+        number=1,
+    )
+
+    tilemap.load(path)
+    tilemap.extract([("spawners", 0), ("spawners", 1), ("water", 0)])
+    offsets = [
+        (
+            rng.randint(left * ts - 160, right * ts - 160),
+            rng.randint(top * ts - 120, bottom * ts - 120),
+        )
+        for _ in range(64)
+    ]
+    offset_cycle = iter(offsets * 1000000)
+
+    def render_tilemap():
+        tilemap.render(game.display, offset=next(offset_cycle))
+
+    for offset in offsets:
+        render_tilemap()
+    results["tilemap.render"] = measure(render_tilemap)
+
+    tilemap.load(path)
+    spawners = tilemap.extract([("spawners", 0), ("spawners", 1)])
+    starts = [spawner["pos"] for spawner in spawners]
+    entities = [PhysicsEntity(game, "machine", start, (8, 15)) for start in starts]
+
+    def reset_entities():
+        for entity, start in zip(entities, starts):
+            entity.pos = list(start)
+            entity.velocity = [0, 0]
+
+    def update_entities():
+        for entity in entities:
+            PhysicsEntity.update(entity, tilemap, (0.5, 0))
+
+    results["physics_entity.update"] = measure(update_entities, setup=reset_entities)
+    results["physics_entity.update"]["entities"] = len(entities)
+
+    batch = []
+
+    def reset_machines():
+        # every machine patrols, so the walk and edge checks are exercised
+        game.spatial.clear()
+        batch[:] = [Machines(game, starts)]
+        batch[0].walking[:] = 60
+
+    results["machines.update"] = measure(
+        lambda: batch[0].update(tilemap), setup=reset_machines
+    )
+    results["machines.update"]["entities"] = len(starts)
+
+    reset_machines()
+    results["spatial.query"] = measure(
+        queries(lambda point: game.spatial.query((point[0], point[1], 8, 16)))
+    )
+    results["spatial.query"]["per_query"] = (
+        results["spatial.query"]["median"] / QUERY_POINTS
+    )
+    results["spatial.pairs"] = measure(game.spatial.pairs)
+    game.spatial.clear()
+    return results
+
+
+def bench_shared(game):
+    results = {}
+
+    particles = Particles(game)
+    rng = random.Random(0)
+
+    def spawn_particles():
+        particles.clear()
+        for _ in range(2000):
+            particles.spawn(
+                "leaf",
+                (rng.uniform(0, 320), rng.uniform(0, 240)),
+                velocity=(rng.uniform(-1, 1), rng.uniform(-1, 1)),
+                frame=rng.randint(0, 20),
+            )
+
+    results["particles.update"] = measure(
+        particles.update, setup=spawn_particles, number=20
+    )
+    results["particles.render"] = measure(
+        lambda: particles.render(game.display), setup=spawn_particles, number=20
+    )
+
+    scroll = [0, 0]
+
+    def render_clouds():
+        scroll[0] += 3
+        scroll[1] += 1
+        game.clouds.update()
+        game.clouds.render(game.display, offset=scroll)
+
+    results["clouds.render"] = measure(render_clouds)
+    results["display.present"] = measure(game.present)
+    return results
+
+
+def run(args):
+    game = Game(headless=True, seed=0)
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": {},
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for path in args.maps:
+            f = open(path, "r")
+            map_data = json.load(f)
+            f.close()
+            for scale in args.scales:
+                bench_path = path
+                if scale != 1:
+                    bench_path = os.path.join(
+                        tmp, f"{os.path.basename(path)}.x{scale}.json"
+                    )
+                    f = open(bench_path, "w")
+                    json.dump(scaled_map(map_data, scale), f)
+                    f.close()
+                label = f"{path}@x{scale}"
+                print(f"benchmarking {label}", file=sys.stderr)
+                binary_path = os.path.join(
+                    tmp, f"{os.path.basename(path)}.x{scale}" + LEVEL_EXTENSION
+                )
+                for name, stats in bench_map(game, bench_path, binary_path).items():
+                    report["results"][label + "::" + name] = stats
+
+    for name, stats in bench_shared(game).items():
+        report["results"]["shared::" + name] = stats
+
+    for name, stats in report["results"].items():
+        print(f"{name:60} {stats['median'] * 1e6:12.1f} us")
+
+    if args.out:
+        f = open(args.out, "w")
+        json.dump(report, f, indent=2)
+        f.close()
+
+
+def compare(args):
+    f = open(args.base, "r")
+    base = json.load(f)["results"]
+    f.close()
+    f = open(args.new, "r")
+    new = json.load(f)["results"]
+    f.close()
+
+    regressions = 0
+    for name in sorted(set(base) & set(new)):
+        before = base[name]["median"]
+        after = new[name]["median"]
+        change = after / before - 1 if before else 0.0
+        flag = ""
+        if change > args.threshold:
+            flag = "REGRESSION"
+            regressions += 1
+        elif change < -args.threshold:
+            flag = "improved"
+        print(
+            f"{name:60} {before * 1e6:12.1f} -> {after * 1e6:12.1f} us "
+            f"{change * 100:+7.1f}% {flag}"
+        )
+    for name in sorted(set(base) ^ set(new)):
+        print(f"{name:60} only in {'base' if name in base else 'new'}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-subsystem microbenchmarks.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run benchmarks")
+    run_parser.add_argument("--out", help="write results as JSON")
+    run_parser.add_argument("--maps", nargs="+", default=MAPS)
+    run_parser.add_argument("--scales", nargs="+", type=int, default=SCALES)
+
+    compare_parser = commands.add_parser("compare", help="diff two result files")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="relative slowdown of the median that counts as a regression",
+    )
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == "__main__":
+    main()
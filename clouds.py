@@ -1,32 +1,89 @@
 import random
 
-class Cloud:
-    def __init__(self, pos, img, speed, depth):
-        self.pos = list(pos)
-        self.img = img
-        self.speed = speed
+import pygame
+
+
+class CloudBand:
+    # clouds sharing one depth and speed, pre-drawn into a wrap-around tile
+    # one period larger than the screen so every cloud appears at most once
+    def __init__(self, clouds, depth, speed):
+        self.clouds = clouds
         self.depth = depth
-    
+        self.speed = speed
+        self.drift = 0
+        self.surf = None
+        self.screen_size = None
+        self.period = None
+
+    def bake(self, screen_size):
+        max_w = max(img.get_width() for pos, img in self.clouds)
+        max_h = max(img.get_height() for pos, img in self.clouds)
+        self.screen_size = screen_size
+        self.period = (screen_size[0] + max_w, screen_size[1] + max_h)
+        self.surf = pygame.Surface(self.period)
+        self.surf.fill((0, 0, 0))
+        for pos, img in self.clouds:
+            x = pos[0] % self.period[0]
+            y = pos[1] % self.period[1]
+            for wrap_x in (x, x - self.period[0]):
+                for wrap_y in (y, y - self.period[1]):
+                    self.surf.blit(img, (wrap_x, wrap_y))
+        self.surf.set_colorkey((0, 0, 0), pygame.RLEACCEL)
+
     def update(self):
-        self.pos[0] += self.speed
-        
+        self.drift += self.speed
+        if self.period:
+            self.drift %= self.period[0]
+
     def render(self, surf, offset=(0, 0)):
-        render_pos = (self.pos[0] - offset[0] * self.depth, self.pos[1] - offset[1] * self.depth)
-        surf.blit(self.img, (render_pos[0] % (surf.get_width() + self.img.get_width()) - self.img.get_width(), render_pos[1] % (surf.get_height() + self.img.get_height()) - self.img.get_height()))
-        
+        if surf.get_size() != self.screen_size:
+            self.bake(surf.get_size())
+        period_x, period_y = self.period
+        origin_x = (self.drift - offset[0] * self.depth) % period_x
+        origin_y = (-offset[1] * self.depth) % period_y
+        for x in (origin_x - period_x, origin_x):
+            if x >= self.screen_size[0] or x + period_x <= 0:
+                continue
+            for y in (origin_y - period_y, origin_y):
+                if y >= self.screen_size[1] or y + period_y <= 0:
+                    continue
+                surf.blit(self.surf, (x, y))
+
+
 class Clouds:
-    def __init__(self, cloud_images, count=16):
-        self.clouds = []
-        
+    def __init__(self, cloud_images, count=16, bands=3):
+        clouds = []
+
         for i in range(count):
-            self.clouds.append(Cloud((random.random() * 99999, random.random() * 99999), random.choice(cloud_images), random.random() * 0.05 + 0.05, random.random() * 0.6 + 0.2))
-        
-        self.clouds.sort(key=lambda x: x.depth)
-    
+            clouds.append(
+                (
+                    (random.random() * 99999, random.random() * 99999),
+                    random.choice(cloud_images),
+                    random.random() * 0.05 + 0.05,
+                    random.random() * 0.6 + 0.2,
+                )
+            )
+
+        clouds.sort(key=lambda x: x[3])
+
+        # split the depth-sorted clouds into bands of similar depth; each band
+        # moves with the mean speed and parallax of its members
+        self.bands = []
+        bands = max(1, min(bands, count))
+        for i in range(bands):
+            members = clouds[i * count // bands : (i + 1) * count // bands]
+            self.bands.append(
+                CloudBand(
+                    [(pos, img) for pos, img, speed, depth in members],
+                    sum(depth for pos, img, speed, depth in members) / len(members),
+                    sum(speed for pos, img, speed, depth in members) / len(members),
+                )
+            )
+
     def update(self):
-        for cloud in self.clouds:
-            cloud.update()
-    
+        for band in self.bands:
+            band.update()
+
     def render(self, surf, offset=(0, 0)):
-        for cloud in self.clouds:
-            cloud.render(surf, offset=offset)
\ No newline at end of file
+        for band in self.bands:
+            band.render(surf, offset=offset)
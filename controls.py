@@ -0,0 +1,86 @@
+import pygame
+
+
+class ControlState:
+    def __init__(self, movement=(False, False), jump=False, dash=False):
+        self.movement = list(movement)
+        self.jump = jump
+        self.dash = dash
+        self.quit = False
+        self.pressed = []
+
+
+class Keyboard:
+    def __init__(self):
+        self.movement = [False, False]
+
+    def poll(self):
+        state = ControlState(self.movement)
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                state.quit = True
+            if event.type == pygame.KEYDOWN:
+                state.pressed.append(event.key)
+                if event.key == pygame.K_LEFT or event.key == pygame.K_a:
+                    self.movement[0] = True
+                if event.key == pygame.K_RIGHT or event.key == pygame.K_d:
+                    self.movement[1] = True
+                if event.key == pygame.K_UP or event.key == pygame.K_w:
+                    state.jump = True
+                if event.key == pygame.K_x or event.key == pygame.K_k:
+                    state.dash = True
+            if event.type == pygame.KEYUP:
+                if event.key == pygame.K_LEFT or event.key == pygame.K_a:
+                    self.movement[0] = False
+                if event.key == pygame.K_RIGHT or event.key == pygame.K_d:
+                    self.movement[1] = False
+        state.movement = list(self.movement)
+        return state
+
+
+class NullControls:
+    def poll(self):
+        return ControlState()
+
+
+class ScriptedControls:
+    # script is a list of (tick, action) pairs where action is one of
+    # "left", "right", "stop", "jump" or "dash"; held movement persists
+    # until the next "left"/"right"/"stop"
+    def __init__(self, script):
+        self.script = sorted(script, key=lambda step: step[0])
+        self.tick = 0
+        self.next_step = 0
+        self.movement = [False, False]
+
+    @classmethod
+    def parse(cls, text):
+        script = []
+        for step in text.split():
+            tick, action = step.split(":")
+            script.append((int(tick), action))
+        return cls(script)
+
+    def poll(self):
+        state = ControlState()
+        while (
+            self.next_step < len(self.script)
+            and self.script[self.next_step][0] <= self.tick
+        ):
+            action = self.script[self.next_step][1]
+            if action == "left":
+                self.movement = [True, False]
+            elif action == "right":
+                self.movement = [False, True]
+            elif action == "stop":
+                self.movement = [False, False]
+            elif action == "jump":
+                state.jump = True
+            elif action == "dash":
+                state.dash = True
+            else:
+                raise ValueError("unknown scripted action: " + action)
+            self.next_step += 1
+        state.movement = list(self.movement)
+        self.tick += 1
+        return state
@@ -5,7 +5,9 @@ import sys
 import pygame
 
 from utils import load_images
+from assets import AssetLoader
 from tilemap import Tilemap
+from presenter import Presenter
 
 RENDER_SCALE = 2.0
 
@@ -17,9 +19,11 @@ class Editor:
         pygame.display.set_caption("editor")
         self.screen = pygame.display.set_mode((640, 480))
         self.display = pygame.Surface((320, 240))
+        self.presenter = Presenter(self.screen, self.display, dirty_rects=True)
 
         self.clock = pygame.time.Clock()
 
+        AssetLoader().preload()
         self.assets = {
             "decor": load_images("tiles/decor"),
             "grass": load_images("tiles/grass"),
@@ -48,6 +52,7 @@ class Editor:
         self.right_clicking = False
         self.shift = False
         self.ongrid = True
+        self.live_autotile = False
 
     async def run(self):
         while True:
@@ -83,16 +88,20 @@ class Editor:
                 self.display.blit(current_tile_img, mpos)
 
             if self.clicking and self.ongrid:
-                self.tilemap.tilemap[str(tile_pos[0]) + ";" + str(tile_pos[1])] = {
-                    "type": self.tile_list[self.tile_group],
-                    "variant": self.tile_variant,
-                    "pos": tile_pos,
-                }
+                tile_type = self.tile_list[self.tile_group]
+                tile = self.tilemap.get_tile(tile_pos)
+                # with live autotiling the variant is the autotiler's call, so
+                # painting over the same type leaves the tile alone
+                if not (self.live_autotile and tile and tile["type"] == tile_type):
+                    self.tilemap.set_tile(tile_pos, tile_type, self.tile_variant)
+                    if self.live_autotile:
+                        self.tilemap.autotile_around(tile_pos)
             if self.right_clicking:
-                tile_loc = str(tile_pos[0]) + ";" + str(tile_pos[1])
-                if tile_loc in self.tilemap.tilemap:
-                    del self.tilemap.tilemap[tile_loc]
-                for tile in self.tilemap.offgrid_tiles.copy():
+                if self.tilemap.remove_tile(tile_pos) and self.live_autotile:
+                    self.tilemap.autotile_around(tile_pos)
+                for tile in self.tilemap.offgrid_in_rect(
+                    (mpos[0] + self.scroll[0], mpos[1] + self.scroll[1], 1, 1)
+                ):
                     tile_img = self.assets[tile["type"]][tile["variant"]]
                     tile_r = pygame.Rect(
                         tile["pos"][0] - self.scroll[0],
@@ -101,7 +110,7 @@ class Editor:
                         tile_img.get_height(),
                     )
                     if tile_r.collidepoint(mpos):
-                        self.tilemap.offgrid_tiles.remove(tile)
+                        self.tilemap.remove_offgrid(tile)
 
             self.display.blit(current_tile_img, (5, 5))
 
@@ -114,15 +123,10 @@ class Editor:
                     if event.button == 1:
                         self.clicking = True
                         if not self.ongrid:
-                            self.tilemap.offgrid_tiles.append(
-                                {
-                                    "type": self.tile_list[self.tile_group],
-                                    "variant": self.tile_variant,
-                                    "pos": (
-                                        mpos[0] + self.scroll[0],
-                                        mpos[1] + self.scroll[1],
-                                    ),
-                                }
+                            self.tilemap.add_offgrid(
+                                self.tile_list[self.tile_group],
+                                self.tile_variant,
+                                (mpos[0] + self.scroll[0], mpos[1] + self.scroll[1]),
                             )
                     if event.button == 3:
                         self.right_clicking = True
@@ -165,6 +169,8 @@ class Editor:
                         self.ongrid = not self.ongrid
                     if event.key == pygame.K_t:
                         self.tilemap.autotile()
+                    if event.key == pygame.K_l:
+                        self.live_autotile = not self.live_autotile
                     if event.key == pygame.K_o:
                         self.tilemap.save("map.json")
                     if event.key == pygame.K_LSHIFT:
@@ -181,10 +187,7 @@ class Editor:
                     if event.key == pygame.K_LSHIFT:
                         self.shift = False
 
-            self.screen.blit(
-                pygame.transform.scale(self.display, self.screen.get_size()), (0, 0)
-            )
-            pygame.display.update()
+            self.presenter.update(self.presenter.present(camera=render_scroll))
             self.clock.tick(60)
             await asyncio.sleep(0)
 
@@ -1,8 +1,6 @@
 import math
 import pygame
 import random
-from particle import Particle
-from spark import Spark
 
 
 class PhysicsEntity:
@@ -10,6 +8,8 @@ class PhysicsEntity:
         self.game = game
         self.type = e_type
         self.pos = list(pos)
+        # position at the start of the current tick, for render interpolation
+        self.prev_pos = list(pos)
         self.size = size
         self.velocity = [0, 0]
         self.collisions = {"up": False, "down": False, "right": False, "left": False}
@@ -24,6 +24,9 @@ class PhysicsEntity:
     def rect(self):
         return pygame.Rect(self.pos[0], self.pos[1], self.size[0], self.size[1])
 
+    def snapshot(self):
+        self.prev_pos = list(self.pos)
+
     def set_action(self, action):
         if action != self.action:
             self.action = action
@@ -37,29 +40,15 @@ class PhysicsEntity:
             movement[1] + self.velocity[1],
         )
 
-        self.pos[0] += frame_movement[0]
-        entity_rect = self.rect()
-        for rect in tilemap.physics_rects_around(self.pos):
-            if entity_rect.colliderect(rect):
-                if frame_movement[0] > 0:
-                    entity_rect.right = rect.left
-                    self.collisions["right"] = True
-                if frame_movement[0] < 0:
-                    entity_rect.left = rect.right
-                    self.collisions["left"] = True
-                self.pos[0] = entity_rect.x
-
-        self.pos[1] += frame_movement[1]
-        entity_rect = self.rect()
-        for rect in tilemap.physics_rects_around(self.pos):
-            if entity_rect.colliderect(rect):
-                if frame_movement[1] > 0:
-                    entity_rect.bottom = rect.top
-                    self.collisions["down"] = True
-                if frame_movement[1] < 0:
-                    entity_rect.top = rect.bottom
-                    self.collisions["up"] = True
-                self.pos[1] = entity_rect.y
+        if frame_movement[0]:
+            self.pos[0], hit = tilemap.sweep(self.pos, self.size, 0, frame_movement[0])
+            if hit:
+                self.collisions["right" if frame_movement[0] > 0 else "left"] = True
+
+        if frame_movement[1]:
+            self.pos[1], hit = tilemap.sweep(self.pos, self.size, 1, frame_movement[1])
+            if hit:
+                self.collisions["down" if frame_movement[1] > 0 else "up"] = True
 
         if movement[0] > 0:
             self.flip = False
@@ -75,12 +64,14 @@ class PhysicsEntity:
 
         self.animation.update()
 
-    def render(self, surf, offset=(0, 0)):
+    def render(self, surf, offset=(0, 0), alpha=1.0):
+        x = self.prev_pos[0] + (self.pos[0] - self.prev_pos[0]) * alpha
+        y = self.prev_pos[1] + (self.pos[1] - self.prev_pos[1]) * alpha
         surf.blit(
-            pygame.transform.flip(self.animation.img(), self.flip, False),
+            self.animation.img(flip=self.flip),
             (
-                self.pos[0] - offset[0] + self.anim_offset[0],
-                self.pos[1] - offset[1] + self.anim_offset[1],
+                x - offset[0] + self.anim_offset[0],
+                y - offset[1] + self.anim_offset[1],
             ),
         )
 
@@ -96,34 +87,26 @@ class Water:
     def rect(self):
         return pygame.Rect(self.pos[0], self.pos[1], self.size[0], self.size[1])
 
-    def update(self):
-        if self.rect().colliderect(self.game.player.rect()):
-            for i in range(30):
-                angle = random.random() * math.pi * 2
-                speed = random.random() * 5
-                self.game.sparks.append(
-                    Spark(
-                        self.rect().center,
-                        angle,
-                        2 + random.random(),
-                    )
-                )
-                self.game.particles.append(
-                    Particle(
-                        self.game,
-                        "particle",
-                        self.rect().center,
-                        velocity=[
-                            math.cos(angle + math.pi) * speed * 0.5,
-                            math.sin(angle + math.pi) * speed * 0.5,
-                        ],
-                        frame=random.randint(0, 7),
-                    )
-                )
-            self.game.sparks.append(Spark(self.rect().center, 0, 5 + random.random()))
-            self.game.sparks.append(Spark(self.rect().center, math.pi, 5 + random.random()))
-            return True
-        return False
+    def catch(self):
+        for i in range(30):
+            angle = random.random() * math.pi * 2
+            speed = random.random() * 5
+            self.game.sparks.spawn(
+                self.rect().center,
+                angle,
+                2 + random.random(),
+            )
+            self.game.particles.spawn(
+                "particle",
+                self.rect().center,
+                velocity=[
+                    math.cos(angle + math.pi) * speed * 0.5,
+                    math.sin(angle + math.pi) * speed * 0.5,
+                ],
+                frame=random.randint(0, 7),
+            )
+        self.game.sparks.spawn(self.rect().center, 0, 5 + random.random())
+        self.game.sparks.spawn(self.rect().center, math.pi, 5 + random.random())
 
     def render(self, surf, offset=(0, 0)):
         surf.blit(
@@ -132,104 +115,6 @@ class Water:
         )
 
 
-class Machine(PhysicsEntity):
-    def __init__(self, game, pos, size):
-        super().__init__(game, "machine", pos, size)
-        self.walking = 0
-
-    def update(self, tilemap, movement=(0, 0)):
-        if self.walking:
-            if tilemap.solid_check(
-                (self.rect().centerx + (-7 if self.flip else 7), self.pos[1] + 23)
-            ):
-                if self.collisions["right"] or self.collisions["left"]:
-                    self.flip = not self.flip
-                else:
-                    movement = (movement[0] - 0.5 if self.flip else 0.5, movement[1])
-            else:
-                self.flip = not self.flip
-            self.walking = max(0, self.walking - 1)
-            if not self.walking:
-                dis = (
-                    self.game.player.pos[0] - self.pos[0],
-                    self.game.player.pos[1] - self.pos[1],
-                )
-                if abs(dis[1]) < 16:
-                    if self.flip and dis[0] < 0:
-                        self.game.sfx["machine"].play()
-                        self.game.sodas.append(
-                            [[self.rect().centerx - 7, self.rect().centery], -1.5, 0]
-                        )
-                        for i in range(4):
-                            self.game.sparks.append(
-                                Spark(
-                                    self.game.sodas[-1][0],
-                                    random.random() - 0.5 + math.pi,
-                                    2 + random.random(),
-                                )
-                            )
-
-                    if not self.flip and dis[0] > 0:
-                        self.game.sfx["machine"].play()
-                        self.game.sodas.append(
-                            [[self.rect().centerx + 7, self.rect().centery], 1.5, 0]
-                        )
-                        for i in range(4):
-                            self.game.sparks.append(
-                                Spark(
-                                    self.game.sodas[-1][0],
-                                    random.random() - 0.5,
-                                    2 + random.random(),
-                                )
-                            )
-
-        elif random.random() < 0.01:
-            self.walking = random.randint(30, 120)
-        super().update(tilemap, movement=movement)
-
-        if abs(self.game.player.dashing) >= 50:
-            if self.rect().colliderect(self.game.player.rect()):
-                self.game.screenshake = max(16, self.game.screenshake)
-                self.game.sfx["sodahit"].play()
-                for i in range(30):
-                    angle = random.random() * math.pi * 2
-                    speed = random.random() * 5
-                    self.game.sparks.append(
-                        Spark(
-                            self.rect().center,
-                            angle,
-                            2 + random.random(),
-                        )
-                    )
-                    self.game.particles.append(
-                        Particle(
-                            self.game,
-                            "particle",
-                            self.rect().center,
-                            velocity=[
-                                math.cos(angle + math.pi) * speed * 0.5,
-                                math.sin(angle + math.pi) * speed * 0.5,
-                            ],
-                            frame=random.randint(0, 7),
-                        )
-                    )
-                self.game.sparks.append(
-                    Spark(self.rect().center, 0, 5 + random.random())
-                )
-                self.game.sparks.append(
-                    Spark(self.rect().center, math.pi, 5 + random.random())
-                )
-                return True
-
-    def render(self, surf, offset=(0, 0)):
-        super().render(surf, offset=offset)
-
-        if self.flip:
-            pass
-        else:
-            pass
-
-
 class Player(PhysicsEntity):
     def __init__(self, game, pos, size):
         super().__init__(game, "player", pos, size)
@@ -275,14 +160,11 @@ class Player(PhysicsEntity):
                 angle = random.random() * math.pi * 2
                 speed = random.random() * 0.5 + 0.5
                 pvelocity = [math.cos(angle) * speed, math.sin(angle) * speed]
-                self.game.particles.append(
-                    Particle(
-                        self.game,
-                        "particle",
-                        self.rect().center,
-                        velocity=pvelocity,
-                        frame=random.randint(0, 7),
-                    )
+                self.game.particles.spawn(
+                    "particle",
+                    self.rect().center,
+                    velocity=pvelocity,
+                    frame=random.randint(0, 7),
                 )
 
         if self.dashing > 0:
@@ -295,14 +177,11 @@ class Player(PhysicsEntity):
             if abs(self.dashing) == 51:
                 self.velocity[0] *= 0.1
             pvelocity = [abs(self.dashing) / self.dashing * random.random() * 3, 0]
-            self.game.particles.append(
-                Particle(
-                    self.game,
-                    "particle",
-                    self.rect().center,
-                    velocity=pvelocity,
-                    frame=random.randint(0, 7),
-                )
+            self.game.particles.spawn(
+                "particle",
+                self.rect().center,
+                velocity=pvelocity,
+                frame=random.randint(0, 7),
             )
 
         if self.velocity[0] > 0:
@@ -310,9 +189,9 @@ class Player(PhysicsEntity):
         else:
             self.velocity[0] = min(self.velocity[0] + 0.1, 0)
 
-    def render(self, surf, offset=(0, 0)):
+    def render(self, surf, offset=(0, 0), alpha=1.0):
         if abs(self.dashing) <= 50:
-            super().render(surf, offset=offset)
+            super().render(surf, offset=offset, alpha=alpha)
 
     def jump(self):
         if self.wall_slide:
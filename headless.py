@@ -0,0 +1,95 @@
+import argparse
+import time
+
+from controls import NullControls, ScriptedControls
+from main import Game
+from replay import Replay, RecordingControls, ReplayControls
+
+
+def simulate(
+    level=0,
+    ticks=3600,
+    render=False,
+    seed=0,
+    script=None,
+    profile_csv=None,
+    record=None,
+    replay=None,
+    hashes=False,
+):
+    if replay:
+        # the replay fixes the level and the seed, and ends the run early
+        recorded = Replay.load(replay)
+        level = recorded.level
+        seed = recorded.seed
+        ticks = min(ticks, len(recorded))
+        controls = ReplayControls(recorded)
+    else:
+        controls = ScriptedControls.parse(script) if script else NullControls()
+        if record:
+            recording = Replay(seed, level, hashes=[] if hashes else None)
+            controls = RecordingControls(controls, recording)
+    game = Game(headless=True, seed=seed, controls=controls, level=level)
+    if hashes and (record or replay):
+        controls.hash_state = game.state_hash
+    if profile_csv:
+        game.profiler.start_csv(profile_csv)
+
+    start = time.perf_counter()
+    for _ in range(ticks):
+        game.profiler.begin_frame()
+        game.step(render=render)
+        game.profiler.end_frame()
+    elapsed = time.perf_counter() - start
+    game.profiler.stop_csv()
+    if record:
+        recording.save(record)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the simulation headless and uncapped, reporting ticks/s."
+    )
+    parser.add_argument("--map", type=int, default=0, help="load maps/<N>.json")
+    parser.add_argument(
+        "--ticks", type=int, default=None, help="default 3600, or the replay length"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--render", action="store_true", help="also draw each tick")
+    parser.add_argument(
+        "--script",
+        default=None,
+        help='scripted input such as "0:right 40:jump 90:dash 150:stop"',
+    )
+    parser.add_argument("--profile-csv", help="write per-tick phase timings here")
+    parser.add_argument("--record", help="save the run's input as a replay")
+    parser.add_argument("--replay", help="drive the run from a recorded replay")
+    parser.add_argument(
+        "--hashes", action="store_true", help="store/check a state hash per tick"
+    )
+    args = parser.parse_args()
+
+    ticks = 3600 if args.ticks is None else args.ticks
+    if args.replay:
+        length = len(Replay.load(args.replay))
+        ticks = length if args.ticks is None else min(ticks, length)
+    elapsed = simulate(
+        args.map,
+        ticks,
+        args.render,
+        args.seed,
+        args.script,
+        args.profile_csv,
+        args.record,
+        args.replay,
+        args.hashes,
+    )
+    print(
+        f"{args.replay or 'map ' + str(args.map)}: {ticks} ticks in {elapsed:.3f}s "
+        f"({ticks / elapsed:.0f} ticks/s, render={'on' if args.render else 'off'})"
+    )
+
+
+if __name__ == "__main__":
+    main()
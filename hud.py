@@ -0,0 +1,67 @@
+import pygame
+
+HUD_COLOR = (255, 255, 255)
+
+
+class TextLabel:
+    # re-renders only when the displayed value changes
+    def __init__(self, font, fmt="{}", color=HUD_COLOR):
+        self.font = font
+        self.fmt = fmt
+        self.color = color
+        self.value = None
+        self.surf = None
+
+    def update(self, value):
+        if self.surf is not None and value == self.value:
+            return False
+        self.value = value
+        self.surf = self.font.render(self.fmt.format(value), True, self.color)
+        return True
+
+
+class Hud:
+    def __init__(self, game):
+        self.game = game
+        self.font = pygame.font.Font(None, 20)
+        self.score = TextLabel(self.font, "{} mL")
+        self.destroyed = TextLabel(self.font)
+        self.phrases = {}
+        self.overlay = None
+        self.overlay_pos = (10, 30)
+        self.dirty = True
+
+    def phrase(self, level):
+        if level not in self.phrases:
+            self.phrases[level] = pygame.transform.scale(
+                self.game.assets["phrases"][level], self.game.display.get_size()
+            )
+        return self.phrases[level]
+
+    def compose(self):
+        # icons and labels are baked into one surface anchored at overlay_pos;
+        # it is filled with the text colour at zero alpha so antialiased text
+        # keeps its exact edges when blended onto it
+        ox, oy = self.overlay_pos
+        width = 22 + max(self.score.surf.get_width(), self.destroyed.surf.get_width())
+        height = 25 + self.destroyed.surf.get_height()
+        if self.overlay is None or self.overlay.get_size() != (width, height):
+            self.overlay = pygame.Surface((width, height), pygame.SRCALPHA)
+        self.overlay.fill(HUD_COLOR + (0,))
+        self.overlay.blit(self.score.surf, (32 - ox, 32 - oy))
+        self.overlay.blit(self.game.assets["liters"], (10 - ox, 30 - oy))
+        self.overlay.blit(self.destroyed.surf, (32 - ox, 55 - oy))
+        self.overlay.blit(self.game.assets["target"], (10 - ox, 50 - oy))
+        self.dirty = False
+
+    def render(self, surf, score, destroyed, level, transition):
+        if transition:
+            surf.blit(self.phrase(level), (0, 0))
+            return
+        if self.score.update(score):
+            self.dirty = True
+        if self.destroyed.update(destroyed):
+            self.dirty = True
+        if self.dirty:
+            self.compose()
+        surf.blit(self.overlay, self.overlay_pos)
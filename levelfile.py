@@ -0,0 +1,203 @@
+import json
+import mmap
+import struct
+import sys
+
+import numpy as np
+
+# Packed level layout, little-endian:
+#   header      HEADER (magic, version, tile_size, origin x/y, width, height,
+#               type count, off-grid count)
+#   type table  per type: u8 name length + utf-8 name, padded to 8 bytes
+#   grid        width * height u8 type ids indexed [x, y] (0 = empty,
+#               n = type_names[n - 1]), then the same shape of u8 variants
+#   off-grid    OFFGRID_RECORD per tile, in placement order
+LEVEL_EXTENSION = ".lvl"
+MAGIC = b"HDLV"
+VERSION = 1
+HEADER = struct.Struct("<4sHHiiIIHI")
+OFFGRID_RECORD = np.dtype(
+    [("type", "u1"), ("variant", "u1"), ("integral", "u1"), ("x", "<f8"), ("y", "<f8")]
+)
+
+
+class LevelData:
+    def __init__(self, tile_size, origin, type_names, types, variants, offgrid):
+        self.tile_size = tile_size
+        self.origin = origin
+        self.type_names = type_names
+        self.types = types
+        self.variants = variants
+        self.offgrid = offgrid
+
+
+def align(offset):
+    return -(-offset // 8) * 8
+
+
+def read_level(path):
+    # the arrays are views straight into the mapped file; nothing is parsed
+    # per tile here
+    f = open(path, "rb")
+    try:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        # no mmap on this platform (or an empty file): fall back to a read
+        data = f.read()
+    f.close()
+
+    (
+        magic,
+        version,
+        tile_size,
+        origin_x,
+        origin_y,
+        width,
+        height,
+        type_count,
+        offgrid_count,
+    ) = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(path + " is not a version " + str(VERSION) + " level file")
+
+    offset = HEADER.size
+    type_names = []
+    for _ in range(type_count):
+        length = data[offset]
+        type_names.append(data[offset + 1 : offset + 1 + length].decode("utf-8"))
+        offset += 1 + length
+    offset = align(offset)
+
+    cells = width * height
+    types = np.frombuffer(data, np.uint8, cells, offset).reshape(width, height)
+    variants = np.frombuffer(data, np.uint8, cells, offset + cells)
+    variants = variants.reshape(width, height)
+    offgrid = np.frombuffer(data, OFFGRID_RECORD, offgrid_count, offset + cells * 2)
+    return LevelData(
+        tile_size, (origin_x, origin_y), type_names, types, variants, offgrid
+    )
+
+
+def write_level(path, tile_size, tiles, offgrid_tiles):
+    # tiles and offgrid_tiles are the same dicts Tilemap keeps in memory
+    type_names = []
+    type_ids = {}
+    for tile in list(tiles) + list(offgrid_tiles):
+        if tile["type"] not in type_ids:
+            type_names.append(tile["type"])
+            type_ids[tile["type"]] = len(type_names)
+    if len(type_names) > 255:
+        raise ValueError("level files hold at most 255 tile types")
+
+    if tiles:
+        xs = [tile["pos"][0] for tile in tiles]
+        ys = [tile["pos"][1] for tile in tiles]
+        origin = (min(xs), min(ys))
+        size = (max(xs) - origin[0] + 1, max(ys) - origin[1] + 1)
+    else:
+        origin = (0, 0)
+        size = (0, 0)
+    types = np.zeros(size, dtype=np.uint8)
+    variants = np.zeros(size, dtype=np.uint8)
+    for tile in tiles:
+        loc = (tile["pos"][0] - origin[0], tile["pos"][1] - origin[1])
+        types[loc] = type_ids[tile["type"]]
+        variants[loc] = tile["variant"]
+
+    offgrid = np.zeros(len(offgrid_tiles), dtype=OFFGRID_RECORD)
+    for i, tile in enumerate(offgrid_tiles):
+        offgrid[i] = (
+            type_ids[tile["type"]],
+            tile["variant"],
+            isinstance(tile["pos"][0], int) and isinstance(tile["pos"][1], int),
+            tile["pos"][0],
+            tile["pos"][1],
+        )
+
+    table = b"".join(
+        bytes([len(name.encode("utf-8"))]) + name.encode("utf-8")
+        for name in type_names
+    )
+    padding = align(HEADER.size + len(table)) - HEADER.size - len(table)
+
+    f = open(path, "wb")
+    f.write(
+        HEADER.pack(
+            MAGIC,
+            VERSION,
+            tile_size,
+            origin[0],
+            origin[1],
+            size[0],
+            size[1],
+            len(type_names),
+            len(offgrid_tiles),
+        )
+    )
+    f.write(table + bytes(padding))
+    f.write(types.tobytes())
+    f.write(variants.tobytes())
+    f.write(offgrid.tobytes())
+    f.close()
+
+
+def level_to_dicts(level):
+    # inverse of write_level: (tile_size, tiles, offgrid_tiles) as plain dicts
+    xs, ys = np.nonzero(level.types)
+    tiles = [
+        {"type": level.type_names[type_id - 1], "variant": variant, "pos": [x, y]}
+        for x, y, type_id, variant in zip(
+            (xs + level.origin[0]).tolist(),
+            (ys + level.origin[1]).tolist(),
+            level.types[xs, ys].tolist(),
+            level.variants[xs, ys].tolist(),
+        )
+    ]
+    offgrid_tiles = []
+    for record in level.offgrid.tolist():
+        type_id, variant, integral, x, y = record
+        if integral:
+            x, y = int(x), int(y)
+        offgrid_tiles.append(
+            {"type": level.type_names[type_id - 1], "variant": variant, "pos": [x, y]}
+        )
+    return level.tile_size, tiles, offgrid_tiles
+
+
+def json_to_level(src, dst):
+    f = open(src, "r")
+    map_data = json.load(f)
+    f.close()
+    write_level(
+        dst,
+        map_data["tile_size"],
+        list(map_data["tilemap"].values()),
+        map_data["offgrid"],
+    )
+
+
+def level_to_json(src, dst):
+    tile_size, tiles, offgrid_tiles = level_to_dicts(read_level(src))
+    f = open(dst, "w")
+    json.dump(
+        {
+            "tilemap": {
+                str(tile["pos"][0]) + ";" + str(tile["pos"][1]): tile
+                for tile in tiles
+            },
+            "tile_size": tile_size,
+            "offgrid": offgrid_tiles,
+        },
+        f,
+    )
+    f.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("usage: python levelfile.py <src.json|src.lvl> <dst.lvl|dst.json>")
+        sys.exit(1)
+    if sys.argv[1].endswith(LEVEL_EXTENSION):
+        level_to_json(sys.argv[1], sys.argv[2])
+    else:
+        json_to_level(sys.argv[1], sys.argv[2])
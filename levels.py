@@ -0,0 +1,77 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+
+from levelfile import LEVEL_EXTENSION
+from tilemap import Tilemap
+from utils import THREADED
+
+LEVEL_DIR = "maps"
+
+
+def level_manifest(root=LEVEL_DIR):
+    # {map id: path}, preferring the binary format when both exist
+    manifest = {}
+    for name in sorted(os.listdir(root)):
+        stem, ext = os.path.splitext(name)
+        if not stem.isdigit() or ext not in (".json", LEVEL_EXTENSION):
+            continue
+        if ext == ".json" and int(stem) in manifest:
+            continue
+        manifest[int(stem)] = os.path.join(root, name)
+    return manifest
+
+
+class PreparedLevel:
+    def __init__(self, map_id, tilemap):
+        self.map_id = map_id
+        self.tilemap = tilemap
+        self.leaf_spawners = []
+        for tree in tilemap.extract([("large_decor", 2)], keep=True):
+            self.leaf_spawners.append(
+                pygame.Rect(4 + tree["pos"][0], 4 + tree["pos"][1], 23, 13)
+            )
+        self.player_pos = None
+        self.machine_positions = []
+        for spawner in tilemap.extract([("spawners", 0), ("spawners", 1)]):
+            if spawner["variant"] == 0:
+                self.player_pos = spawner["pos"]
+            else:
+                self.machine_positions.append(spawner["pos"])
+        self.bottle_positions = [
+            bottle["pos"] for bottle in tilemap.extract([("water", 0)])
+        ]
+
+
+class LevelPipeline:
+    # parses and extracts levels off the main thread so that switching
+    # levels only swaps in an already built tilemap
+    def __init__(self, game, root=LEVEL_DIR):
+        self.game = game
+        self.manifest = level_manifest(root)
+        self.pending = {}
+        # without threads, levels are prepared when they are taken
+        self.pool = ThreadPoolExecutor(1) if THREADED else None
+
+    def __len__(self):
+        return len(self.manifest)
+
+    def prepare(self, map_id):
+        tilemap = Tilemap(self.game, tile_size=self.game.tilemap.tile_size)
+        tilemap.load(self.manifest[map_id])
+        return PreparedLevel(map_id, tilemap)
+
+    def prefetch(self, map_id):
+        if map_id not in self.manifest or map_id in self.pending:
+            return
+        if self.pool:
+            self.pending[map_id] = self.pool.submit(self.prepare, map_id)
+
+    def take(self, map_id):
+        # a prepared level is consumed by the game (extract mutates the
+        # tilemap), so each prefetch serves one load
+        job = self.pending.pop(map_id, None)
+        if job is not None:
+            return job.result()
+        return self.prepare(map_id)
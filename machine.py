@@ -0,0 +1,319 @@
+import math
+import random
+
+import numpy as np
+
+from utils import flip_x
+
+MACHINE_SIZE = (8, 15)
+ANIM_OFFSET = (-3, -3)
+# below this many machines numpy's per-call overhead costs more than the work
+# it saves, so small levels step the machines one by one with the same rules
+BATCH_MIN = 48
+
+
+class Machines:
+    # every vending machine in the level as parallel arrays, stepped
+    # together. Patrol, gravity and tile collision are vectorized; the rare
+    # events that draw random numbers (idle rolls, firing, being dashed
+    # through) run afterwards in list order, so a seeded run consumes the
+    # random stream exactly as one update per machine object did. Each
+    # machine is registered in game.spatial as ("machine", id).
+    def __init__(self, game, positions=(), size=MACHINE_SIZE):
+        self.game = game
+        self.spatial = game.spatial
+        self.size = size
+        self.animation = game.assets["machine/idle"]
+        count = len(positions)
+        self.pos = np.array(positions, dtype=np.float64).reshape(count, 2)
+        self.prev_pos = self.pos.copy()
+        self.velocity_y = np.zeros(count)
+        self.flip = np.zeros(count, dtype=bool)
+        self.walking = np.zeros(count, dtype=np.int64)
+        # stopped by a wall on the last step, which turns a patrol around
+        self.blocked = np.zeros(count, dtype=bool)
+        self.frame = np.zeros(count, dtype=np.int64)
+        # ids stay ascending through removals, so searchsorted maps them back
+        self.ids = np.arange(count)
+        self.registered = self.rects()
+        for machine_id, (x, y) in enumerate(self.registered.tolist()):
+            self.spatial.insert(("machine", machine_id), (x, y, size[0], size[1]))
+
+    def __len__(self):
+        return len(self.pos)
+
+    def rects(self):
+        # integer x, y of every machine rect, truncated like pygame.Rect
+        return np.trunc(self.pos).astype(np.int64)
+
+    def snapshot(self):
+        self.prev_pos = self.pos.copy()
+
+    def awake(self, region):
+        # machines whose rect overlaps region (x, y, w, h) are simulated; the
+        # rest sleep untouched until the camera brings the region to them
+        if region is None:
+            return np.ones(len(self), dtype=bool)
+        x, y = self.registered[:, 0], self.registered[:, 1]
+        w, h = self.size
+        return (
+            (x < region[0] + region[2])
+            & (x + w > region[0])
+            & (y < region[1] + region[3])
+            & (y + h > region[1])
+        )
+
+    def update(self, tilemap, region=None):
+        # returns how many machines were destroyed this step
+        if not len(self):
+            return 0
+        awake = self.awake(region)
+        active = np.flatnonzero(awake)
+        idle = awake & (self.walking == 0)
+        fire_rects = self.rects()
+        fire = np.zeros(len(self), dtype=bool)
+        if len(active):
+            move = self.move_each if len(active) < BATCH_MIN else self.move_batch
+            (
+                self.pos[active],
+                self.velocity_y[active],
+                self.flip[active],
+                self.walking[active],
+                self.blocked[active],
+                fire[active],
+            ) = move(
+                tilemap,
+                self.pos[active],
+                self.velocity_y[active],
+                self.flip[active],
+                self.walking[active],
+                self.blocked[active],
+            )
+            self.frame[active] = (self.frame[active] + 1) % (
+                self.animation.img_duration * len(self.animation.images)
+            )
+        rects = self.sync()
+
+        player = self.game.player
+        killed = np.zeros(len(self), dtype=bool)
+        if abs(player.dashing) >= 50:
+            hits = [i for kind, i in self.spatial.query(player.rect(), "machine")]
+            killed[np.searchsorted(self.ids, hits)] = True
+
+        for i in np.flatnonzero(idle | fire | killed).tolist():
+            if fire[i]:
+                self.fire(fire_rects[i], self.flip[i])
+            elif idle[i] and random.random() < 0.01:
+                self.walking[i] = random.randint(30, 120)
+            if killed[i]:
+                self.explode(rects[i])
+
+        if killed.any():
+            self.keep(~killed)
+        return int(killed.sum())
+
+    def move_each(self, tilemap, pos, velocity_y, flip, walking, blocked):
+        # steps the given machines one by one; returns their new state and
+        # which of them finished a patrol facing the player
+        player = self.game.player
+        ts = tilemap.tile_size
+        w, h = self.size
+        pos = pos.tolist()
+        velocity_y = velocity_y.tolist()
+        flip = flip.tolist()
+        walking = walking.tolist()
+        blocked = blocked.tolist()
+        fire = [False] * len(pos)
+
+        for i in range(len(pos)):
+            x, y = pos[i]
+            movement = 0
+            if walking[i]:
+                probe = (int(x) + w // 2 + (-7 if flip[i] else 7), y + 23)
+                if tilemap.solid.get((int(probe[0] // ts), int(probe[1] // ts))):
+                    if blocked[i]:
+                        flip[i] = not flip[i]
+                    else:
+                        movement = -0.5 if flip[i] else 0.5
+                else:
+                    flip[i] = not flip[i]
+                walking[i] -= 1
+                if not walking[i]:
+                    dis = (player.pos[0] - x, player.pos[1] - y)
+                    if abs(dis[1]) < 16 and (dis[0] < 0 if flip[i] else dis[0] > 0):
+                        fire[i] = True
+
+            blocked[i] = False
+            if movement:
+                x, blocked[i] = tilemap.sweep((x, y), self.size, 0, movement)
+            landed = False
+            if velocity_y[i]:
+                y, landed = tilemap.sweep((x, y), self.size, 1, velocity_y[i])
+            velocity_y[i] = 0 if landed else min(5, velocity_y[i] + 0.1)
+            pos[i] = (x, y)
+
+        return pos, velocity_y, flip, walking, blocked, fire
+
+    def move_batch(self, tilemap, pos, velocity_y, flip, walking, blocked):
+        # the same step as move_each for all given machines at once
+        player = self.game.player
+        ts = tilemap.tile_size
+        w, h = self.size
+        rects = np.trunc(pos).astype(np.int64)
+
+        moving = walking > 0
+        probe_x = rects[:, 0] + w // 2 + np.where(flip, -7, 7)
+        probe_y = np.floor_divide(pos[:, 1] + 23, ts).astype(np.int64)
+        ground = tilemap.solid.lookup(probe_x // ts, probe_y)
+        flip ^= moving & (~ground | blocked)
+        step = moving & ground & ~blocked
+        movement = np.where(step, np.where(flip, -0.5, 0.5), 0.0)
+        walking[moving] -= 1
+
+        dis_x = player.pos[0] - pos[:, 0]
+        dis_y = player.pos[1] - pos[:, 1]
+        fire = (
+            moving
+            & (walking == 0)
+            & (np.abs(dis_y) < 16)
+            & np.where(flip, dis_x < 0, dis_x > 0)
+        )
+
+        pos[:, 0], blocked = self.sweep(tilemap, pos, 0, movement)
+        pos[:, 1], landed = self.sweep(tilemap, pos, 1, velocity_y)
+        velocity_y = np.minimum(5, velocity_y + 0.1)
+        velocity_y[landed] = 0
+        return pos, velocity_y, flip, walking, blocked, fire
+
+    def sync(self):
+        # moves the spatial hash entries of machines whose rect changed
+        rects = self.rects()
+        changed = np.flatnonzero((rects != self.registered).any(axis=1))
+        if len(changed):
+            w, h = self.size
+            self.spatial.move_many(
+                [("machine", i) for i in self.ids[changed].tolist()],
+                [(x, y, w, h) for x, y in rects[changed].tolist()],
+            )
+            self.registered = rects
+        return rects
+
+    def sweep(self, tilemap, pos, axis, delta):
+        # Tilemap.sweep for many machines at once: each machine scans the
+        # cell lines its leading edge crosses and stops at the first solid one
+        moving = delta != 0
+        if not moving.any():
+            return pos[:, axis] + delta, moving
+        ts = tilemap.tile_size
+        across = 1 - axis
+        size = self.size
+        rects = np.trunc(pos).astype(np.int64)
+        start = rects[:, axis]
+        end = np.trunc(pos[:, axis] + delta).astype(np.int64)
+        first = rects[:, across] // ts
+        last = (rects[:, across] + size[across] - 1) // ts
+        forward = delta > 0
+        lead = np.where(forward, size[axis] - 1, 0)
+        cell = (start + lead) // ts
+        steps = np.abs((end + lead) // ts - cell)
+        direction = np.where(forward, 1, -1)
+
+        # every (line crossed, cell across) pair at once, shaped (k, j, n)
+        k = np.arange(int(steps[moving].max()) + 1)[:, None, None]
+        j = np.arange(int((last - first).max()) + 1)[None, :, None]
+        lines = cell + k * direction + 0 * j
+        others = first + j + 0 * k
+        xs, ys = (lines, others) if axis == 0 else (others, lines)
+        solid = tilemap.solid.lookup(xs.ravel(), ys.ravel()).reshape(lines.shape)
+        solid &= (k <= steps) & (first + j <= last) & moving
+        blocked = solid.any(axis=1)
+        hit = blocked.any(axis=0)
+        result = pos[:, axis] + delta
+        # the first blocked line along the path is where the machine stops
+        line = cell + blocked.argmax(axis=0) * direction
+        stop = np.where(forward, line * ts - size[axis], (line + 1) * ts)
+        result[hit] = stop[hit]
+        return result, hit
+
+    def fire(self, rect, flip):
+        game = self.game
+        w, h = self.size
+        game.sfx["machine"].play()
+        if flip:
+            soda_pos = (int(rect[0]) + w // 2 - 7, int(rect[1]) + h // 2)
+            game.sodas.spawn(soda_pos, -1.5)
+            base = math.pi
+        else:
+            soda_pos = (int(rect[0]) + w // 2 + 7, int(rect[1]) + h // 2)
+            game.sodas.spawn(soda_pos, 1.5)
+            base = 0
+        for _ in range(4):
+            game.sparks.spawn(
+                soda_pos, random.random() - 0.5 + base, 2 + random.random()
+            )
+
+    def explode(self, rect):
+        game = self.game
+        w, h = self.size
+        center = (int(rect[0]) + w // 2, int(rect[1]) + h // 2)
+        game.screenshake = max(16, game.screenshake)
+        game.sfx["sodahit"].play()
+        for _ in range(30):
+            angle = random.random() * math.pi * 2
+            speed = random.random() * 5
+            game.sparks.spawn(center, angle, 2 + random.random())
+            game.particles.spawn(
+                "particle",
+                center,
+                velocity=[
+                    math.cos(angle + math.pi) * speed * 0.5,
+                    math.sin(angle + math.pi) * speed * 0.5,
+                ],
+                frame=random.randint(0, 7),
+            )
+        game.sparks.spawn(center, 0, 5 + random.random())
+        game.sparks.spawn(center, math.pi, 5 + random.random())
+
+    def keep(self, mask):
+        for machine_id in self.ids[~mask].tolist():
+            self.spatial.remove(("machine", machine_id))
+        self.ids = self.ids[mask]
+        self.registered = self.registered[mask]
+        self.prev_pos = self.prev_pos[mask]
+        self.pos = self.pos[mask]
+        self.velocity_y = self.velocity_y[mask]
+        self.flip = self.flip[mask]
+        self.walking = self.walking[mask]
+        self.blocked = self.blocked[mask]
+        self.frame = self.frame[mask]
+
+    def render(self, surf, offset=(0, 0), alpha=1.0):
+        if not len(self):
+            return
+        images = self.animation.images
+        flipped = self.animation.transformed_frames("flip", flip_x)
+        pos = self.prev_pos + (self.pos - self.prev_pos) * alpha
+        x = pos[:, 0] - offset[0] + ANIM_OFFSET[0]
+        y = pos[:, 1] - offset[1] + ANIM_OFFSET[1]
+        # only machines whose sprite reaches the surface are drawn
+        img_w = max(img.get_width() for img in images)
+        img_h = max(img.get_height() for img in images)
+        visible = np.flatnonzero(
+            (x < surf.get_width())
+            & (x + img_w > 0)
+            & (y < surf.get_height())
+            & (y + img_h > 0)
+        )
+        indices = (self.frame[visible] // self.animation.img_duration).tolist()
+        surf.blits(
+            [
+                ((flipped if flip else images)[index], (px, py))
+                for flip, index, px, py in zip(
+                    self.flip[visible].tolist(),
+                    indices,
+                    x[visible].tolist(),
+                    y[visible].tolist(),
+                )
+            ],
+            doreturn=False,
+        )
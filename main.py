@@ -3,20 +3,81 @@ import asyncio
 import numpy as np  # Add numpy first if you plan to use it
 
 from utils import load_image, load_images, Animation
-from entities import PhysicsEntity, Player, Machine, Water
+from assets import AssetLoader
+from audio import Audio
+from entities import PhysicsEntity, Player, Water
+from machine import Machines
 from tilemap import Tilemap
+from levels import LevelPipeline
 from clouds import Clouds
-from particle import Particle
-from spark import Spark
+from controls import Keyboard
+from replay import Replay, RecordingControls, ReplayControls
+from particle import Particles
+from spark import Sparks
+from projectile import Projectiles
+from profiler import Profiler
+from hud import Hud
+from presenter import Presenter
+from spatial import SpatialHash
 
 import sys
 import os
 import random
 import math
+import time
+import struct
+import zlib
+import argparse
+
+# entities further than this outside the view sleep instead of simulating
+SIM_MARGIN = 160
+# the simulation always advances in fixed ticks; rendering runs as fast as
+# MAX_FPS allows and interpolates between the last two ticks
+TICK_RATE = 60
+TICK = 1 / TICK_RATE
+MAX_FPS = 144
+# ticks run per frame at most; beyond that the game slows down instead of
+# falling further and further behind
+MAX_CATCH_UP = 5
+
+PROFILER_PHASES = [
+    "input",
+    "level",
+    "clouds",
+    "tilemap",
+    "machines",
+    "bottles",
+    "player",
+    "sodas",
+    "particles",
+    "hud",
+    "present",
+]
+
+# name: (path, volume, stream)
+AUDIO_MANIFEST = {
+    "jump": ("music/jump.ogg", 0.7, False),
+    "dash": ("music/dash.ogg", 0.3, False),
+    "sodahit": ("music/sodahit.ogg", 0.4, False),
+    "machine": ("music/machine.ogg", 0.8, False),
+    "ambience": ("music/ambience.ogg", 0.2, False),
+    "water": ("music/water.ogg", 0.5, False),
+    "music": ("music.ogg", 0.3, True),
+}
 
 
 class Game:
-    def __init__(self):
+    def __init__(self, headless=False, seed=None, controls=None, level=0):
+        if headless:
+            # SDL picks these up at init; no window or audio device is opened
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
+            os.environ["SDL_AUDIODRIVER"] = "dummy"
+        if seed is not None:
+            random.seed(seed)
+        # screenshake draws from its own generator so that the number of
+        # rendered frames never shifts the simulation's random stream
+        self.shake_random = random.Random(seed)
+
         pygame.init()
 
         pygame.display.set_caption("hidratate")
@@ -24,10 +85,17 @@ class Game:
 
         self.screen = pygame.display.set_mode((640, 480))
         self.display = pygame.Surface((320, 240))
+        self.presenter = Presenter(self.screen, self.display, dirty_rects=True)
+        self.render_scroll = (0, 0)
 
         self.clock = pygame.time.Clock()
 
+        AssetLoader(progress=None if headless else self.draw_loading).preload()
+
         self.movement = [False, False]
+        self.controls = controls or Keyboard()
+        self.profiler = Profiler(PROFILER_PHASES)
+        self.hud = Hud(self)
 
         self.assets = {
             "decor": load_images("tiles/decor"),
@@ -56,59 +124,66 @@ class Game:
             "phrases": load_images("tiles/phrases"),
         }
 
-        self.sfx = {
-            "jump": pygame.mixer.Sound("music/jump.ogg"),
-            "dash": pygame.mixer.Sound("music/dash.ogg"),
-            "sodahit": pygame.mixer.Sound("music/sodahit.ogg"),
-            "machine": pygame.mixer.Sound("music/machine.ogg"),
-            "ambience": pygame.mixer.Sound("music/ambience.ogg"),
-            "water": pygame.mixer.Sound("music/water.ogg"),
-        }
-
-        self.sfx["ambience"].set_volume(0.2)
-        self.sfx["dash"].set_volume(0.3)
-        self.sfx["sodahit"].set_volume(0.4)
-        self.sfx["machine"].set_volume(0.8)
-        self.sfx["jump"].set_volume(0.7)
-        self.sfx["water"].set_volume(0.5)
+        self.sfx = Audio()
+        for name, (path, volume, stream) in AUDIO_MANIFEST.items():
+            self.sfx.register(name, path, volume=volume, stream=stream)
+        self.sfx.preload(["jump", "dash", "sodahit", "machine", "water"])
 
         self.clouds = Clouds(self.assets["clouds"], count=16)
 
+        self.particles = Particles(self)
+        self.sparks = Sparks(capacity=512, overflow="evict")
+        self.spatial = SpatialHash()
+        self.sodas = Projectiles(self.spatial)
+
         self.player = Player(self, (50, 50), (8, 15))
 
         self.tilemap = Tilemap(self, tile_size=16)
 
-        self.level = 0
+        self.levels = LevelPipeline(self)
+        self.level = level
         self.load_level(self.level)
         self.screenshake = 0
 
-    def load_level(self, map_id):
-        self.tilemap.load("maps/" + str(map_id) + ".json")
-        self.leaf_spawners = []
-        for tree in self.tilemap.extract([("large_decor", 2)], keep=True):
-            self.leaf_spawners.append(
-                pygame.Rect(4 + tree["pos"][0], 4 + tree["pos"][1], 23, 13)
-            )
-
-        self.machines = []
-
-        self.bottles = []
+    def draw_loading(self, done, total):
+        bar = pygame.Rect(0, 0, 400, 12)
+        bar.center = self.screen.get_rect().center
+        self.screen.fill((0, 0, 0))
+        pygame.draw.rect(self.screen, (255, 255, 255), bar, 1)
+        if total:
+            fill = bar.inflate(-4, -4)
+            fill.width = fill.width * done // total
+            pygame.draw.rect(self.screen, (255, 255, 255), fill)
+        pygame.event.pump()
+        pygame.display.update()
+
+    def view_rect(self, margin=0):
+        return pygame.Rect(
+            int(self.scroll[0]) - margin,
+            int(self.scroll[1]) - margin,
+            self.display.get_width() + margin * 2,
+            self.display.get_height() + margin * 2,
+        )
 
-        for spawner in self.tilemap.extract([("spawners", 0), ("spawners", 1)]):
-            if spawner["variant"] == 0:
-                self.player.pos = spawner["pos"]
-                self.player.air_time = 0
-            else:
-                self.machines.append(Machine(self, spawner["pos"], (8, 15)))
-
-        for bottle in self.tilemap.extract([("water", 0)]):
-            if bottle["variant"] == 0:
-                self.bottles.append(Water(self, bottle["pos"], (8, 15)))
-
-        self.sodas = []
-        self.particles = []
-        self.font = pygame.font.Font(None, 20)
-        self.sparks = []
+    def load_level(self, map_id):
+        self.sodas.clear()
+        self.spatial.clear()
+        level = self.levels.take(map_id)
+        self.tilemap = level.tilemap
+        self.leaf_spawners = level.leaf_spawners
+        if level.player_pos is not None:
+            self.player.pos = level.player_pos
+            self.player.air_time = 0
+        self.machines = Machines(self, level.machine_positions)
+        self.bottles = {}
+        for bottle_id, pos in enumerate(level.bottle_positions):
+            self.bottles[bottle_id] = Water(self, pos, (8, 15))
+            self.spatial.insert(("water", bottle_id), self.bottles[bottle_id].rect())
+        # the next level is parsed while this one is played
+        self.levels.prefetch(min(map_id + 1, len(self.levels) - 1))
+
+        self.particles.clear()
+        self.sparks.clear()
         self.score = 0
 
         self.score_by_bottle = self.liters / len(self.bottles)
@@ -116,195 +191,282 @@ class Game:
         self.dead = 0
         self.transition = -30
         self.destroyed = 0
-
-    async def run(self):
-        pygame.mixer.music.load("music.ogg")
-        pygame.mixer.music.set_volume(0.3)
-        pygame.mixer.music.play(-1)
-
-        while True:
-            self.display.blit(self.assets["background"], (0, 0))
-            self.screenshake = max(0, self.screenshake - 1)
-
-            if not len(self.bottles) and not len(self.machines):
-                self.transition += 1
-                if self.transition > 30:
-                    self.level = min(self.level + 1, len(os.listdir("maps/")) - 1)
-                    self.load_level(self.level)
-            if self.transition < 0:
-                self.transition += 0.25
-
-            if self.dead:
+        self.snapshot()
+
+    def snapshot(self):
+        # start-of-tick state that render interpolates from
+        self.prev_scroll = list(self.scroll)
+        self.player.snapshot()
+        self.machines.snapshot()
+        self.sodas.snapshot()
+        self.sparks.snapshot()
+        self.particles.snapshot()
+
+    def state_hash(self):
+        # a cheap fingerprint of the simulation for replay desync checks;
+        # render-only state (screenshake, interpolation) stays out of it
+        state = struct.pack(
+            "<6d5i",
+            self.player.pos[0],
+            self.player.pos[1],
+            self.player.velocity[0],
+            self.player.velocity[1],
+            self.scroll[0],
+            self.scroll[1],
+            self.level,
+            self.dead,
+            self.destroyed,
+            len(self.bottles),
+            len(self.machines.pos),
+        )
+        crc = zlib.crc32(state)
+        crc = zlib.crc32(self.machines.pos.tobytes(), crc)
+        crc = zlib.crc32(self.sodas.pos[: len(self.sodas)].tobytes(), crc)
+        counts = struct.pack("<2i", len(self.sparks), len(self.particles))
+        return zlib.crc32(counts, crc)
+
+    def process_input(self):
+        controls = self.controls.poll()
+        if controls.quit:
+            pygame.quit()
+            sys.exit()
+        self.movement = controls.movement
+        if controls.jump:
+            if self.player.jump():
+                self.sfx["jump"].play()
+        if controls.dash:
+            self.player.dash()
+        if pygame.K_F3 in controls.pressed:
+            self.profiler.toggle_overlay()
+        if pygame.K_F4 in controls.pressed:
+            self.profiler.toggle_csv(time.strftime("profile-%Y%m%d-%H%M%S.csv"))
+        self.profiler.mark("input")
+
+    def update(self):
+        self.screenshake = max(0, self.screenshake - 1)
+
+        if not len(self.bottles) and not len(self.machines):
+            self.transition += 1
+            if self.transition > 30:
+                self.level = min(self.level + 1, len(self.levels) - 1)
+                self.load_level(self.level)
+        if self.transition < 0:
+            self.transition += 0.25
+
+        if self.dead:
+            # restarting needs a fresh copy of the current level
+            self.levels.prefetch(self.level)
+            self.dead += 1
+            if self.dead >= 10:
+                self.transition = min(30, self.transition + 1)
+            if self.dead > 40:
+                self.score = 0
+                self.destroyed = 0
+                self.load_level(self.level)
+
+        self.scroll[0] += (
+            self.player.rect().centerx
+            - self.display.get_width() / 2
+            - self.scroll[0]
+        ) / 30
+        self.scroll[1] += (
+            self.player.rect().centery
+            - self.display.get_height() / 2
+            - self.scroll[1]
+        ) / 30
+
+        for rect in self.leaf_spawners:
+            if random.random() * 49999 < rect.width * rect.height:
+                pos = (
+                    rect.x + random.random() * rect.width,
+                    rect.y + random.random() * rect.height,
+                )
+                self.particles.spawn(
+                    "particle",
+                    pos,
+                    velocity=[-0.1, 0.3],
+                    frame=random.randint(0, 20),
+                )
+        self.profiler.mark("level")
+
+        self.clouds.update()
+        self.profiler.mark("clouds")
+
+        self.destroyed += self.machines.update(
+            self.tilemap, region=self.view_rect(SIM_MARGIN)
+        )
+        self.profiler.mark("machines")
+
+        for key in self.spatial.query(self.player.rect(), "water"):
+            self.spatial.remove(key)
+            self.bottles.pop(key[1]).catch()
+            self.sfx["water"].play()
+            self.score += self.score_by_bottle
+        self.profiler.mark("bottles")
+
+        if not self.dead:
+            self.player.update(self.tilemap, (self.movement[1] - self.movement[0], 0))
+        self.profiler.mark("player")
+
+        target_rect = None
+        if abs(self.player.dashing) < 50:
+            target_rect = self.player.rect()
+        for kind, pos, direction in self.sodas.update(self.tilemap, target_rect):
+            if kind == "wall":
+                for i in range(4):
+                    self.sparks.spawn(
+                        pos,
+                        random.random() - 0.5 + (math.pi if direction > 0 else 0),
+                        2 + random.random(),
+                    )
+            else:
                 self.dead += 1
-                if self.dead >= 10:
-                    self.transition = min(30, self.transition + 1)
-                if self.dead > 40:
-                    self.score = 0
-                    self.destroyed = 0
-                    self.load_level(self.level)
-
-            self.scroll[0] += (
-                self.player.rect().centerx
-                - self.display.get_width() / 2
-                - self.scroll[0]
-            ) / 30
-            self.scroll[1] += (
-                self.player.rect().centery
-                - self.display.get_height() / 2
-                - self.scroll[1]
-            ) / 30
-            render_scroll = (int(self.scroll[0]), int(self.scroll[1]))
-
-            for rect in self.leaf_spawners:
-                if random.random() * 49999 < rect.width * rect.height:
-                    pos = (
-                        rect.x + random.random() * rect.width,
-                        rect.y + random.random() * rect.height,
+                self.sfx["sodahit"].play()
+                self.screenshake = max(16, self.screenshake)
+                for i in range(30):
+                    angle = random.random() * math.pi * 2
+                    speed = random.random() * 5
+                    self.sparks.spawn(
+                        self.player.rect().center,
+                        angle,
+                        2 + random.random(),
                     )
-                    self.particles.append(
-                        Particle(
-                            self,
-                            "particle",
-                            pos,
-                            velocity=[-0.1, 0.3],
-                            frame=random.randint(0, 20),
-                        )
+                    self.particles.spawn(
+                        "particle",
+                        self.player.rect().center,
+                        velocity=[
+                            math.cos(angle + math.pi) * speed * 0.5,
+                            math.sin(angle + math.pi) * speed * 0.5,
+                        ],
+                        frame=random.randint(0, 7),
                     )
+        self.profiler.mark("sodas")
+
+        self.sparks.update()
+        self.particles.update()
+        self.profiler.mark("particles")
+
+    def render(self, alpha=1.0):
+        # alpha is how far the frame lies between the previous tick and the
+        # current one
+        render_scroll = (
+            int(self.prev_scroll[0] + (self.scroll[0] - self.prev_scroll[0]) * alpha),
+            int(self.prev_scroll[1] + (self.scroll[1] - self.prev_scroll[1]) * alpha),
+        )
+        self.render_scroll = render_scroll
+
+        self.display.blit(self.assets["background"], (0, 0))
+        self.clouds.render(self.display, offset=render_scroll)
+        self.profiler.mark("clouds")
+        self.tilemap.render(self.display, offset=render_scroll)
+        self.profiler.mark("tilemap")
+
+        self.machines.render(self.display, offset=render_scroll, alpha=alpha)
+        self.profiler.mark("machines")
+        # bottle sprites hang right and down from their rect corner, so a
+        # sprite's worth of margin catches every visible one
+        margin = max(self.assets["water"].get_size())
+        for kind, bottle_id in self.spatial.query(self.view_rect(margin), "water"):
+            self.bottles[bottle_id].render(self.display, offset=render_scroll)
+        self.profiler.mark("bottles")
+        if not self.dead:
+            self.player.render(self.display, offset=render_scroll, alpha=alpha)
+        self.profiler.mark("player")
+
+        self.sodas.render(
+            self.display, self.assets["soda"], offset=render_scroll, alpha=alpha
+        )
+        self.profiler.mark("sodas")
+        self.sparks.render(self.display, offset=render_scroll, alpha=alpha)
+        self.particles.render(self.display, offset=render_scroll, alpha=alpha)
+        self.profiler.mark("particles")
+
+        self.hud.render(
+            self.display, self.score, self.destroyed, self.level, self.transition
+        )
+        self.profiler.mark("hud")
+
+    def present(self):
+        screenshake_offset = (
+            self.shake_random.random() * self.screenshake - self.screenshake / 2,
+            self.shake_random.random() * self.screenshake - self.screenshake / 2,
+        )
+        rects = self.presenter.present(
+            screenshake_offset,
+            camera=self.render_scroll,
+            allow_dirty=not self.profiler.overlay,
+        )
+        self.profiler.render(self.screen)
+        self.presenter.update(rects)
+        self.profiler.mark("present")
+
+    def tick(self):
+        self.snapshot()
+        self.process_input()
+        self.update()
+
+    def step(self, render=True):
+        self.tick()
+        if render:
+            self.render()
 
-            self.clouds.update()
-            self.clouds.render(self.display, offset=render_scroll)
-
-            self.tilemap.render(self.display, offset=render_scroll)
-
-            for machine in self.machines.copy():
-                kill = machine.update(self.tilemap, (0, 0))
-                machine.render(self.display, offset=render_scroll)
-                if kill:
-                    self.machines.remove(machine)
-                    self.destroyed += 1
-
-            for bottle in self.bottles.copy():
-                catch = bottle.update()
-                bottle.render(self.display, offset=render_scroll)
-                if catch:
-                    self.sfx["water"].play()
-                    self.bottles.remove(bottle)
-                    self.score += self.score_by_bottle
-            if not self.dead:
-                self.player.update(
-                    self.tilemap, (self.movement[1] - self.movement[0], 0)
-                )
-                self.player.render(self.display, offset=render_scroll)
-
-            # [position,direction,time]
-            for soda in self.sodas.copy():
-                soda[0][0] += soda[1]
-                soda[2] += 1
-                img = self.assets["soda"]
-                self.display.blit(
-                    img,
-                    (
-                        soda[0][0] - img.get_width() / 2 - render_scroll[0],
-                        soda[0][1] - img.get_height() / 2 - render_scroll[1],
-                    ),
-                )
-                if self.tilemap.solid_check(soda[0]):
-                    self.sodas.remove(soda)
-                    for i in range(4):
-                        self.sparks.append(
-                            Spark(
-                                soda[0],
-                                random.random() - 0.5 + (math.pi if soda[1] > 0 else 0),
-                                2 + random.random(),
-                            )
-                        )
-                elif soda[2] > 360:
-                    self.sodas.remove(soda)
-                elif abs(self.player.dashing) < 50:
-                    if self.player.rect().collidepoint(soda[0]):
-                        self.sodas.remove(soda)
-                        self.dead += 1
-                        self.sfx["sodahit"].play()
-                        self.screenshake = max(16, self.screenshake)
-                        for i in range(30):
-                            angle = random.random() * math.pi * 2
-                            speed = random.random() * 5
-                            self.sparks.append(
-                                Spark(
-                                    self.player.rect().center,
-                                    angle,
-                                    2 + random.random(),
-                                )
-                            )
-                            self.particles.append(
-                                Particle(
-                                    self,
-                                    "particle",
-                                    self.player.rect().center,
-                                    velocity=[
-                                        math.cos(angle + math.pi) * speed * 0.5,
-                                        math.sin(angle + math.pi) * speed * 0.5,
-                                    ],
-                                    frame=random.randint(0, 7),
-                                )
-                            )
-            for particle in self.particles.copy():
-                kill = particle.update()
-                particle.render(self.display, offset=render_scroll)
-                if particle.type == "leaf":
-                    particle.pos[0] += math.sin(particle.animation.frame * 0.035) * 0.3
-                if kill:
-                    self.particles.remove(particle)
-
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_LEFT or event.key == pygame.K_a:
-                        self.movement[0] = True
-                    if event.key == pygame.K_RIGHT or event.key == pygame.K_d:
-                        self.movement[1] = True
-                    if event.key == pygame.K_UP or event.key == pygame.K_w:
-                        if self.player.jump():
-                            self.sfx["jump"].play()
-
-                    if event.key == pygame.K_x or event.key == pygame.K_k:
-                        self.player.dash()
-                if event.type == pygame.KEYUP:
-                    if event.key == pygame.K_LEFT or event.key == pygame.K_a:
-                        self.movement[0] = False
-                    if event.key == pygame.K_RIGHT or event.key == pygame.K_d:
-                        self.movement[1] = False
-
-            if self.transition:
-                img_phrase = pygame.transform.scale(
-                    self.assets["phrases"][self.level], (320, 240)
-                )
-                self.display.blit(img_phrase, (0, 0))
+    async def run(self):
+        self.sfx.play_music("music")
 
-            else:
-                target_text = self.font.render(
-                    f"{self.destroyed}", True, (255, 255, 255)
-                )
-                score_text = self.font.render(f"{self.score} mL", True, (255, 255, 255))
-                self.display.blit(score_text, (32, 32))
-                self.display.blit(self.assets["liters"], (10, 30))
-                self.display.blit(target_text, (32, 55))
-                self.display.blit(self.assets["target"], (10, 50))
-            screenshake_offset = (
-                random.random() * self.screenshake - self.screenshake / 2,
-                random.random() * self.screenshake - self.screenshake / 2,
-            )
-            self.screen.blit(
-                pygame.transform.scale(self.display, self.screen.get_size()),
-                screenshake_offset,
-            )
-
-            pygame.display.update()
-            self.clock.tick(60)
+        accumulator = 0.0
+        last = time.perf_counter()
+        while True:
+            now = time.perf_counter()
+            accumulator += now - last
+            last = now
+
+            self.profiler.begin_frame()
+            ticks = 0
+            while accumulator >= TICK and ticks < MAX_CATCH_UP:
+                self.tick()
+                accumulator -= TICK
+                ticks += 1
+            if accumulator >= TICK:
+                # overloaded: drop the backlog rather than spiral
+                accumulator = TICK
+            self.render(alpha=accumulator / TICK)
+            self.present()
+            self.profiler.end_frame()
+            self.clock.tick(MAX_FPS)
             await asyncio.sleep(0)
 
 
+def main():
+    parser = argparse.ArgumentParser(description="Play hidratate.")
+    parser.add_argument("--map", type=int, default=0, help="start on maps/<N>")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--record", help="write this session's input to a replay")
+    parser.add_argument(
+        "--hashes", action="store_true", help="store/check a state hash per tick"
+    )
+    parser.add_argument("--replay", help="play back a recorded session")
+    args = parser.parse_args()
+
+    level = args.map
+    seed = args.seed
+    controls = None
+    if args.replay:
+        replay = Replay.load(args.replay)
+        level = replay.level
+        seed = replay.seed
+        controls = ReplayControls(replay)
+    elif args.record:
+        if seed is None:
+            # a replay only reproduces a seeded run
+            seed = random.randrange(2**31)
+        replay = Replay(seed, level, hashes=[] if args.hashes else None)
+        controls = RecordingControls(Keyboard(), replay, args.record)
+
+    game = Game(seed=seed, controls=controls, level=level)
+    if controls is not None and args.hashes:
+        controls.hash_state = game.state_hash
+    asyncio.run(game.run())
+
+
 if __name__ == "__main__":
-    asyncio.run(Game().run())
+    main()
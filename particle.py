@@ -1,30 +1,126 @@
-class Particle:
-    def __init__(self, game, p_type, pos, velocity=[0, 0], frame=0):
+import numpy as np
+
+# particle types that drift sideways on a sine of their animation frame
+SWAY_TYPES = {"leaf"}
+
+
+class Particles:
+    def __init__(self, game, capacity=256):
         self.game = game
-        self.type = p_type
-        self.pos = list(pos)
-        self.velocity = list(velocity)
-        self.animation = self.game.assets["particle/" + p_type].copy()
-        self.animation.frame = frame
+        self.type_ids = {}
+        self.frames = []
+        self.frame_base = np.zeros(0, dtype=np.int32)
+        self.img_duration = np.ones(0, dtype=np.int32)
+        self.frame_limit = np.ones(0, dtype=np.int32)
+        self.loop = np.zeros(0, dtype=bool)
+        self.sway = np.zeros(0, dtype=bool)
+        self.half_size = np.zeros((0, 2))
+
+        self.pos = np.zeros((capacity, 2))
+        self.prev_pos = np.zeros((capacity, 2))
+        self.velocity = np.zeros((capacity, 2))
+        self.frame = np.zeros(capacity, dtype=np.int32)
+        self.type = np.zeros(capacity, dtype=np.int32)
+        self.done = np.zeros(capacity, dtype=bool)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def type_id(self, p_type):
+        if p_type not in self.type_ids:
+            animation = self.game.assets["particle/" + p_type]
+            self.type_ids[p_type] = len(self.type_ids)
+            self.frame_base = np.append(self.frame_base, len(self.frames))
+            self.img_duration = np.append(self.img_duration, animation.img_duration)
+            self.frame_limit = np.append(
+                self.frame_limit, animation.img_duration * len(animation.images)
+            )
+            self.loop = np.append(self.loop, animation.loop)
+            self.sway = np.append(self.sway, p_type in SWAY_TYPES)
+            self.frames.extend(animation.images)
+            self.half_size = np.append(
+                self.half_size,
+                [
+                    [img.get_width() // 2, img.get_height() // 2]
+                    for img in animation.images
+                ],
+                axis=0,
+            )
+        return self.type_ids[p_type]
+
+    def grow(self):
+        capacity = len(self.frame) * 2
+        self.pos = np.resize(self.pos, (capacity, 2))
+        self.prev_pos = np.resize(self.prev_pos, (capacity, 2))
+        self.velocity = np.resize(self.velocity, (capacity, 2))
+        self.frame = np.resize(self.frame, capacity)
+        self.type = np.resize(self.type, capacity)
+        self.done = np.resize(self.done, capacity)
+
+    def spawn(self, p_type, pos, velocity=(0, 0), frame=0):
+        if self.count == len(self.frame):
+            self.grow()
+        i = self.count
+        self.pos[i] = pos
+        self.prev_pos[i] = pos
+        self.velocity[i] = velocity
+        self.frame[i] = frame
+        self.type[i] = self.type_id(p_type)
+        self.done[i] = False
+        self.count += 1
+
+    def clear(self):
+        self.count = 0
+
+    def snapshot(self):
+        self.prev_pos[: self.count] = self.pos[: self.count]
 
     def update(self):
-        kill = False
+        n = self.count
+        if not n:
+            return
+
+        kill = self.done[:n].copy()
+
+        self.pos[:n] += self.velocity[:n]
 
-        if self.animation.done:
-            kill = True
+        types = self.type[:n]
+        limit = self.frame_limit[types]
+        loop = self.loop[types]
+        frame = self.frame[:n] + 1
+        frame = np.where(loop, frame % limit, np.minimum(frame, limit - 1))
+        self.frame[:n] = frame
+        self.done[:n] |= ~loop & (frame >= limit - 1)
 
-        self.pos[0] += self.velocity[0]
-        self.pos[1] += self.velocity[1]
+        sway = self.sway[types]
+        if sway.any():
+            self.pos[:n, 0][sway] += np.sin(frame[sway] * 0.035) * 0.3
 
-        self.animation.update()
-        return kill
+        if kill.any():
+            keep = ~kill
+            alive = int(keep.sum())
+            self.pos[:alive] = self.pos[:n][keep]
+            self.prev_pos[:alive] = self.prev_pos[:n][keep]
+            self.velocity[:alive] = self.velocity[:n][keep]
+            self.frame[:alive] = self.frame[:n][keep]
+            self.type[:alive] = self.type[:n][keep]
+            self.done[:alive] = self.done[:n][keep]
+            self.count = alive
 
-    def render(self, surf, offset=(0, 0)):
-        img = self.animation.img()
-        surf.blit(
-            img,
-            (
-                self.pos[0] - offset[0] - img.get_width() // 2,
-                self.pos[1] - offset[1] - img.get_height() // 2,
-            ),
+    def render(self, surf, offset=(0, 0), alpha=1.0):
+        n = self.count
+        if not n:
+            return
+        types = self.type[:n]
+        images = self.frame_base[types] + self.frame[:n] // self.img_duration[types]
+        pos = self.prev_pos[:n] + (self.pos[:n] - self.prev_pos[:n]) * alpha
+        corners = pos - self.half_size[images] - offset
+        frames = self.frames
+        surf.blits(
+            [
+                (frames[img], corner)
+                for img, corner in zip(images.tolist(), corners.tolist())
+            ],
+            doreturn=False,
         )
@@ -0,0 +1,157 @@
+import numpy as np
+import pygame
+
+# dirty-rect detection compares the low-res display in square blocks; a
+# multiple of 8 so block rows can be tested as whole 64-bit words
+DIRTY_BLOCK = 16
+
+
+class Presenter:
+    def __init__(self, screen, display, dirty_rects=False):
+        self.screen = screen
+        self.display = display
+        screen_size = screen.get_size()
+        display_size = display.get_size()
+
+        self.scale = None
+        if (
+            screen_size[0] % display_size[0] == 0
+            and screen_size[1] % display_size[1] == 0
+        ):
+            self.scale = (
+                screen_size[0] // display_size[0],
+                screen_size[1] // display_size[1],
+            )
+            self.buffer = None
+        else:
+            self.buffer = pygame.Surface(screen_size)
+
+        self.dirty_rects = (
+            dirty_rects
+            and self.scale is not None
+            and display.get_bytesize() == 4
+            and display_size[0] % DIRTY_BLOCK == 0
+            and display_size[1] % DIRTY_BLOCK == 0
+        )
+        self.previous = None
+        self.changed = None
+        if self.dirty_rects:
+            self.previous = np.zeros(display_size[::-1], dtype=np.uint32)
+            self.changed = np.zeros(display_size[::-1], dtype=bool)
+        self.previous_valid = False
+        self.last_camera = None
+
+    def scale_region(self, rect):
+        # scales one display-space rect straight into the matching screen area
+        sx, sy = self.scale
+        pygame.transform.scale(
+            self.display.subsurface(rect),
+            (rect[2] * sx, rect[3] * sy),
+            self.screen.subsurface(
+                (rect[0] * sx, rect[1] * sy, rect[2] * sx, rect[3] * sy)
+            ),
+        )
+
+    def remember(self):
+        pixels = pygame.surfarray.pixels2d(self.display).T
+        np.copyto(self.previous, pixels)
+        del pixels
+
+    def changed_rects(self):
+        # pixels2d is indexed [x, y]; its transpose is contiguous row-major
+        pixels = pygame.surfarray.pixels2d(self.display).T
+        np.not_equal(pixels, self.previous, out=self.changed)
+        np.copyto(self.previous, pixels)
+        del pixels
+
+        # reduce each block with 64-bit words instead of per-byte bools
+        height, width = self.changed.shape
+        rows = height // DIRTY_BLOCK
+        columns = width // DIRTY_BLOCK
+        words = self.changed.view(np.uint64).reshape(rows, DIRTY_BLOCK, -1)
+        blocks = words.any(axis=1).reshape(rows, columns, -1).any(axis=2)
+
+        # merge runs of dirty blocks along each block row into one rect
+        rects = []
+        for row in range(rows):
+            dirty = np.flatnonzero(blocks[row]).tolist()
+            start = None
+            for i, column in enumerate(dirty):
+                if start is None:
+                    start = column
+                if i + 1 == len(dirty) or dirty[i + 1] != column + 1:
+                    rects.append(
+                        (
+                            start * DIRTY_BLOCK,
+                            row * DIRTY_BLOCK,
+                            (column - start + 1) * DIRTY_BLOCK,
+                            DIRTY_BLOCK,
+                        )
+                    )
+                    start = None
+        return rects
+
+    def present(self, shake=(0, 0), camera=None, allow_dirty=True):
+        # returns the screen rects that changed, or None for the whole window
+        if self.scale is None:
+            pygame.transform.scale(self.display, self.screen.get_size(), self.buffer)
+            if shake != (0, 0):
+                self.screen.fill((0, 0, 0))
+            self.screen.blit(self.buffer, shake)
+            return None
+
+        sx, sy = self.scale
+        width, height = self.display.get_size()
+        # shake is applied in whole display pixels by scaling a shifted
+        # sub-rect of the display straight into the window
+        dx = int(round(shake[0] / sx))
+        dy = int(round(shake[1] / sy))
+
+        still = dx == 0 and dy == 0 and camera == self.last_camera
+        self.last_camera = camera
+
+        if self.dirty_rects and still and allow_dirty and self.previous_valid:
+            rects = self.changed_rects()
+            for rect in rects:
+                self.scale_region(rect)
+            return [
+                pygame.Rect(rect[0] * sx, rect[1] * sy, rect[2] * sx, rect[3] * sy)
+                for rect in rects
+            ]
+
+        if self.dirty_rects:
+            self.remember()
+            # when dirty rects are refused something is drawn over the
+            # window after scaling (the profiler overlay), so the frame
+            # after it has to be scaled in full again
+            self.previous_valid = dx == 0 and dy == 0 and allow_dirty
+
+        if dx == 0 and dy == 0:
+            pygame.transform.scale(self.display, self.screen.get_size(), self.screen)
+            return None
+
+        src = pygame.Rect(
+            max(0, -dx), max(0, -dy), width - abs(dx), height - abs(dy)
+        )
+        dst = pygame.Rect(
+            max(0, dx) * sx, max(0, dy) * sy, src.width * sx, src.height * sy
+        )
+        pygame.transform.scale(
+            self.display.subsurface(src), dst.size, self.screen.subsurface(dst)
+        )
+        screen_width, screen_height = self.screen.get_size()
+        for strip in (
+            pygame.Rect(0, 0, screen_width, dst.top),
+            pygame.Rect(0, dst.bottom, screen_width, screen_height - dst.bottom),
+            pygame.Rect(0, dst.top, dst.left, dst.height),
+            pygame.Rect(dst.right, dst.top, screen_width - dst.right, dst.height),
+        ):
+            if strip.width > 0 and strip.height > 0:
+                self.screen.fill((0, 0, 0), strip)
+        return None
+
+    def update(self, rects=None):
+        if rects is None:
+            pygame.display.update()
+        elif rects:
+            pygame.display.update(rects)
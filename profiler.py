@@ -0,0 +1,129 @@
+import time
+
+import numpy as np
+import pygame
+
+FRAME_BUDGET_MS = 1000 / 60
+
+
+class Profiler:
+    # time between consecutive mark() calls is charged to the named phase;
+    # every method returns immediately while the profiler is disabled
+    def __init__(self, phases, history=240):
+        self.phases = list(phases)
+        self.phase_ids = {phase: i for i, phase in enumerate(self.phases)}
+        self.history = np.zeros((history, len(self.phases)))
+        self.current = np.zeros(len(self.phases))
+        self.frames = 0
+        self.last = 0
+        self.enabled = False
+        self.overlay = False
+        self.overlay_surf = None
+        self.csv_file = None
+        self.font = None
+
+    def update_enabled(self):
+        self.enabled = self.overlay or self.csv_file is not None
+
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+        self.overlay_surf = None
+        self.update_enabled()
+
+    def start_csv(self, path):
+        self.stop_csv()
+        self.csv_file = open(path, "w")
+        self.csv_file.write(",".join(["frame"] + self.phases + ["total"]) + "\n")
+        self.update_enabled()
+
+    def stop_csv(self):
+        if self.csv_file is not None:
+            self.csv_file.close()
+            self.csv_file = None
+        self.update_enabled()
+
+    def toggle_csv(self, path):
+        if self.csv_file is None:
+            self.start_csv(path)
+        else:
+            self.stop_csv()
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        self.current[:] = 0
+        self.last = time.perf_counter()
+
+    def mark(self, phase):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.current[self.phase_ids[phase]] += (now - self.last) * 1000
+        self.last = now
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        self.history[self.frames % len(self.history)] = self.current
+        if self.csv_file is not None:
+            values = self.current.tolist()
+            self.csv_file.write(
+                ",".join(
+                    [str(self.frames)]
+                    + [f"{value:.4f}" for value in values]
+                    + [f"{sum(values):.4f}"]
+                )
+                + "\n"
+            )
+        self.frames += 1
+        if self.overlay and self.frames % 15 == 0:
+            self.overlay_surf = None
+
+    def stats(self):
+        # {phase: (mean, p95, max)} in milliseconds over the ring buffer,
+        # with "total" covering whole frames
+        samples = self.history[: min(self.frames, len(self.history))]
+        if not len(samples):
+            return {}
+        columns = dict(zip(self.phases, samples.T))
+        columns["total"] = samples.sum(axis=1)
+        return {
+            phase: (
+                float(values.mean()),
+                float(np.percentile(values, 95)),
+                float(values.max()),
+            )
+            for phase, values in columns.items()
+        }
+
+    def render(self, surf):
+        if not self.overlay:
+            return
+        if self.overlay_surf is None:
+            if self.font is None:
+                self.font = pygame.font.Font(None, 16)
+            rows = [("phase", "mean", "p95", "max ms", (255, 255, 255))]
+            for phase, (mean, p95, peak) in self.stats().items():
+                over = phase == "total" and p95 > FRAME_BUDGET_MS
+                rows.append(
+                    (
+                        phase,
+                        f"{mean:.2f}",
+                        f"{p95:.2f}",
+                        f"{peak:.2f}",
+                        (255, 90, 90) if over else (255, 255, 255),
+                    )
+                )
+            line_height = self.font.get_linesize()
+            self.overlay_surf = pygame.Surface((220, line_height * len(rows) + 8))
+            self.overlay_surf.set_alpha(200)
+            for i, row in enumerate(rows):
+                y = 4 + i * line_height
+                self.overlay_surf.blit(self.font.render(row[0], True, row[4]), (4, y))
+                # right-align the numbers so columns line up in any font
+                for column, text in zip((120, 165, 215), row[1:4]):
+                    text_surf = self.font.render(text, True, row[4])
+                    self.overlay_surf.blit(
+                        text_surf, (column - text_surf.get_width(), y)
+                    )
+        surf.blit(self.overlay_surf, (surf.get_width() - 224, 4))
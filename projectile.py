@@ -0,0 +1,115 @@
+import numpy as np
+
+SODA_LIFETIME = 360
+
+
+class Projectiles:
+    # each live projectile is a 1x1 box at its truncated position in the
+    # spatial hash, keyed ("soda", id)
+    def __init__(self, spatial, capacity=64):
+        self.spatial = spatial
+        self.pos = np.zeros((capacity, 2))
+        self.prev_pos = np.zeros((capacity, 2))
+        self.direction = np.zeros(capacity)
+        self.time = np.zeros(capacity, dtype=np.int32)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.registered = np.zeros((capacity, 2), dtype=np.int64)
+        self.count = 0
+        self.next_id = 0
+
+    def __len__(self):
+        return self.count
+
+    def spawn(self, pos, direction):
+        if self.count == len(self.time):
+            capacity = self.count * 2
+            self.pos = np.resize(self.pos, (capacity, 2))
+            self.prev_pos = np.resize(self.prev_pos, (capacity, 2))
+            self.direction = np.resize(self.direction, capacity)
+            self.time = np.resize(self.time, capacity)
+            self.ids = np.resize(self.ids, capacity)
+            self.registered = np.resize(self.registered, (capacity, 2))
+        i = self.count
+        self.pos[i] = pos
+        self.prev_pos[i] = pos
+        self.direction[i] = direction
+        self.time[i] = 0
+        self.ids[i] = self.next_id
+        self.registered[i] = (int(pos[0]), int(pos[1]))
+        self.spatial.insert(("soda", self.next_id), (int(pos[0]), int(pos[1]), 1, 1))
+        self.next_id += 1
+        self.count += 1
+
+    def remove(self, i):
+        # swap the last projectile into the hole; order is not meaningful
+        last = self.count - 1
+        self.spatial.remove(("soda", int(self.ids[i])))
+        self.pos[i] = self.pos[last]
+        self.prev_pos[i] = self.prev_pos[last]
+        self.direction[i] = self.direction[last]
+        self.time[i] = self.time[last]
+        self.ids[i] = self.ids[last]
+        self.registered[i] = self.registered[last]
+        self.count = last
+
+    def clear(self):
+        for soda_id in self.ids[: self.count].tolist():
+            self.spatial.remove(("soda", soda_id))
+        self.count = 0
+
+    def snapshot(self):
+        self.prev_pos[: self.count] = self.pos[: self.count]
+
+    def sync(self):
+        n = self.count
+        points = np.trunc(self.pos[:n]).astype(np.int64)
+        changed = np.flatnonzero((points != self.registered[:n]).any(axis=1))
+        if len(changed):
+            self.spatial.move_many(
+                [("soda", i) for i in self.ids[changed].tolist()],
+                [(x, y, 1, 1) for x, y in points[changed].tolist()],
+            )
+            self.registered[:n] = points
+
+    def update(self, tilemap, target_rect=None):
+        # returns ("wall" | "hit", pos, direction) for every despawn that
+        # should trigger effects; expired projectiles vanish silently
+        n = self.count
+        if not n:
+            return []
+        pos = self.pos[:n]
+        pos[:, 0] += self.direction[:n]
+        self.time[:n] += 1
+        self.sync()
+
+        wall = tilemap.solid_check_many(pos)
+        expired = ~wall & (self.time[:n] > SODA_LIFETIME)
+        hit = np.zeros(n, dtype=bool)
+        if target_rect:
+            index = {soda_id: i for i, soda_id in enumerate(self.ids[:n].tolist())}
+            for kind, soda_id in self.spatial.query(target_rect, "soda"):
+                hit[index[soda_id]] = True
+            hit &= ~wall & ~expired
+
+        events = []
+        despawn = np.flatnonzero(wall | expired | hit)
+        for i in despawn.tolist():
+            if wall[i] or hit[i]:
+                kind = "wall" if wall[i] else "hit"
+                events.append(
+                    (kind, tuple(pos[i].tolist()), float(self.direction[i]))
+                )
+        for i in despawn[::-1].tolist():
+            self.remove(i)
+        return events
+
+    def render(self, surf, img, offset=(0, 0), alpha=1.0):
+        n = self.count
+        if not n:
+            return
+        pos = self.prev_pos[:n] + (self.pos[:n] - self.prev_pos[:n]) * alpha
+        corners = pos - (
+            img.get_width() / 2 + offset[0],
+            img.get_height() / 2 + offset[1],
+        )
+        surf.blits([(img, corner) for corner in corners.tolist()], doreturn=False)
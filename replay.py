@@ -0,0 +1,126 @@
+import struct
+import zlib
+
+from controls import ControlState
+
+# Replay layout, little-endian:
+#   header  HEADER (magic, version, flags, seed, start level, tick count)
+#   body    zlib-compressed: one input byte per tick (INPUT_* bits), then
+#           with FLAG_HASHES one u32 state hash per tick
+REPLAY_EXTENSION = ".rpl"
+MAGIC = b"HDRP"
+VERSION = 1
+HEADER = struct.Struct("<4sHHqII")
+FLAG_HASHES = 1
+
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_JUMP = 4
+INPUT_DASH = 8
+
+
+def encode_input(state):
+    bits = 0
+    if state.movement[0]:
+        bits |= INPUT_LEFT
+    if state.movement[1]:
+        bits |= INPUT_RIGHT
+    if state.jump:
+        bits |= INPUT_JUMP
+    if state.dash:
+        bits |= INPUT_DASH
+    return bits
+
+
+def decode_input(bits):
+    return ControlState(
+        movement=(bool(bits & INPUT_LEFT), bool(bits & INPUT_RIGHT)),
+        jump=bool(bits & INPUT_JUMP),
+        dash=bool(bits & INPUT_DASH),
+    )
+
+
+class Replay:
+    # hashes, when kept, hold Game.state_hash() taken as each tick polls its
+    # input, i.e. the state that tick starts from
+    def __init__(self, seed, level=0, inputs=None, hashes=None):
+        self.seed = seed
+        self.level = level
+        self.inputs = bytearray() if inputs is None else bytearray(inputs)
+        self.hashes = hashes
+
+    def __len__(self):
+        return len(self.inputs)
+
+    def save(self, path):
+        body = bytes(self.inputs)
+        flags = 0
+        if self.hashes is not None:
+            flags |= FLAG_HASHES
+            body += struct.pack(f"<{len(self.hashes)}I", *self.hashes)
+        f = open(path, "wb")
+        f.write(HEADER.pack(MAGIC, VERSION, flags, self.seed, self.level, len(self)))
+        f.write(zlib.compress(body))
+        f.close()
+
+    @classmethod
+    def load(cls, path):
+        f = open(path, "rb")
+        data = f.read()
+        f.close()
+        magic, version, flags, seed, level, ticks = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(path + " is not a version " + str(VERSION) + " replay")
+        body = zlib.decompress(data[HEADER.size :])
+        hashes = None
+        if flags & FLAG_HASHES:
+            hashes = list(struct.unpack_from(f"<{ticks}I", body, ticks))
+        return cls(seed, level, body[:ticks], hashes)
+
+
+class RecordingControls:
+    # passes another control source through unchanged while writing each
+    # tick's input (and, with hash_state set, the state hash) into replay;
+    # the replay is saved to path when the game is closed
+    def __init__(self, inner, replay, path=None, hash_state=None):
+        self.inner = inner
+        self.replay = replay
+        self.path = path
+        self.hash_state = hash_state
+
+    def poll(self):
+        state = self.inner.poll()
+        if state.quit:
+            if self.path:
+                self.replay.save(self.path)
+            return state
+        if self.hash_state is not None:
+            self.replay.hashes.append(self.hash_state())
+        self.replay.inputs.append(encode_input(state))
+        return state
+
+
+class ReplayControls:
+    # feeds a recorded session back one tick at a time and quits at its end;
+    # with hash_state set, every tick is checked against the recorded hash
+    def __init__(self, replay, hash_state=None):
+        self.replay = replay
+        self.hash_state = hash_state
+        self.tick = 0
+
+    def poll(self):
+        if self.tick >= len(self.replay):
+            state = ControlState()
+            state.quit = True
+            return state
+        if self.hash_state is not None and self.replay.hashes is not None:
+            expected = self.replay.hashes[self.tick]
+            actual = self.hash_state()
+            if actual != expected:
+                raise RuntimeError(
+                    f"replay diverged at tick {self.tick}: "
+                    f"state hash {actual:08x}, recorded {expected:08x}"
+                )
+        state = decode_input(self.replay.inputs[self.tick])
+        self.tick += 1
+        return state
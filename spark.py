@@ -1,50 +1,83 @@
-import math
+import numpy as np
 import pygame
 
+SPARK_OVERFLOW_POLICIES = {"evict", "reject"}
 
-class Spark:
-    def __init__(self, pos, angle, speed):
-        self.pos = list(pos)
-        self.angle = angle
-        self.speed = speed
+
+class Sparks:
+    def __init__(self, capacity=512, overflow="evict"):
+        if overflow not in SPARK_OVERFLOW_POLICIES:
+            raise ValueError("unknown spark overflow policy: " + str(overflow))
+        self.capacity = capacity
+        self.overflow = overflow
+        self.pos = np.zeros((capacity, 2))
+        self.prev_pos = np.zeros((capacity, 2))
+        self.direction = np.zeros((capacity, 2))
+        self.speed = np.zeros(capacity)
+        self.count = 0
+        # the pool is a ring once it fills up: head is the oldest slot. It is
+        # only ever non-zero while the pool is full, so the live sparks are
+        # always the first `count` slots
+        self.head = 0
+
+    def __len__(self):
+        return self.count
+
+    def spawn(self, pos, angle, speed):
+        if self.count == self.capacity:
+            if self.overflow == "reject":
+                return False
+            # overwrite the oldest spark in place
+            i = self.head
+            self.head = (i + 1) % self.capacity
+        else:
+            i = self.count
+            self.count += 1
+        self.pos[i] = pos
+        self.prev_pos[i] = pos
+        self.direction[i] = (np.cos(angle), np.sin(angle))
+        self.speed[i] = speed
+        return True
+
+    def clear(self):
+        self.count = 0
+        self.head = 0
+
+    def snapshot(self):
+        self.prev_pos[: self.count] = self.pos[: self.count]
 
     def update(self):
-        self.pos[0] += math.cos(self.angle) * self.speed
-        self.pos[1] += math.sin(self.angle) * self.speed
-
-        self.speed = max(0, self.speed - 0.1)
-        return not self.speed
-
-    def render(self, surf, offset=(0, 0)):
-        render_points = [
-            (
-                self.pos[0] + math.cos(self.angle) * self.speed * 3 - offset[0],
-                self.pos[1] + math.sin(self.angle) * self.speed * 3 - offset[1],
-            ),
-            (
-                self.pos[0]
-                + math.cos(self.angle + math.pi * 0.5) * self.speed * 0.5
-                - offset[0],
-                self.pos[1]
-                + math.sin(self.angle + math.pi * 0.5) * self.speed * 0.5
-                - offset[1],
-            ),
-            (
-                self.pos[0]
-                + math.cos(self.angle + math.pi) * self.speed * 3
-                - offset[0],
-                self.pos[1]
-                + math.sin(self.angle + math.pi) * self.speed * 3
-                - offset[1],
-            ),
-            (
-                self.pos[0]
-                + math.cos(self.angle - math.pi * 0.5) * self.speed * 0.5
-                - offset[0],
-                self.pos[1]
-                + math.sin(self.angle - math.pi * 0.5) * self.speed * 0.5
-                - offset[1],
-            ),
-        ]
-
-        pygame.draw.polygon(surf, (255, 255, 255), render_points)
+        n = self.count
+        if not n:
+            return
+        self.pos[:n] += self.direction[:n] * self.speed[:n, None]
+        np.maximum(self.speed[:n] - 0.1, 0, out=self.speed[:n])
+
+        keep = self.speed[:n] > 0
+        if not keep.all():
+            # survivors are packed oldest first, which unrolls the ring
+            order = np.arange(self.head, self.head + n) % n
+            order = order[keep[order]]
+            alive = len(order)
+            self.pos[:alive] = self.pos[order]
+            self.prev_pos[:alive] = self.prev_pos[order]
+            self.direction[:alive] = self.direction[order]
+            self.speed[:alive] = self.speed[order]
+            self.count = alive
+            self.head = 0
+
+    def render(self, surf, offset=(0, 0), alpha=1.0):
+        n = self.count
+        if not n:
+            return
+        pos = self.prev_pos[:n] + (self.pos[:n] - self.prev_pos[:n]) * alpha
+        center = pos - offset
+        speed = self.speed[:n, None]
+        forward = self.direction[:n] * speed * 3
+        side = self.direction[:n, ::-1] * (-1, 1) * speed * 0.5
+        points = np.stack(
+            (center + forward, center + side, center - forward, center - side),
+            axis=1,
+        )
+        for render_points in points.tolist():
+            pygame.draw.polygon(surf, (255, 255, 255), render_points)
@@ -0,0 +1,102 @@
+CELL_SIZE = 32
+
+
+def overlaps(a, b):
+    # same rule as Rect.colliderect for (x, y, w, h) boxes
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and (
+        a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+    )
+
+
+class SpatialHash:
+    # uniform grid broadphase: each registered box is listed in every cell it
+    # touches, so an overlap query only looks at objects in nearby cells.
+    # Keys are (kind, id) tuples and boxes whole-pixel (x, y, w, h).
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.boxes = {}
+        self.ranges = {}
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def __contains__(self, key):
+        return key in self.boxes
+
+    def cell_range(self, box):
+        size = self.cell_size
+        return (
+            int(box[0] // size),
+            int(box[1] // size),
+            int((box[0] + box[2] - 1) // size),
+            int((box[1] + box[3] - 1) // size),
+        )
+
+    def range_cells(self, cell_range):
+        left, top, right, bottom = cell_range
+        for cell_x in range(left, right + 1):
+            for cell_y in range(top, bottom + 1):
+                yield (cell_x, cell_y)
+
+    def link(self, key, cell_range):
+        self.ranges[key] = cell_range
+        for cell in self.range_cells(cell_range):
+            self.cells.setdefault(cell, {})[key] = True
+
+    def unlink(self, key):
+        for cell in self.range_cells(self.ranges.pop(key)):
+            bucket = self.cells[cell]
+            del bucket[key]
+            if not bucket:
+                del self.cells[cell]
+
+    def insert(self, key, box):
+        self.boxes[key] = box
+        self.link(key, self.cell_range(box))
+
+    def remove(self, key):
+        del self.boxes[key]
+        self.unlink(key)
+
+    def move(self, key, box):
+        # cheap while the box stays within the same cells
+        self.boxes[key] = box
+        cell_range = self.cell_range(box)
+        if cell_range != self.ranges[key]:
+            self.unlink(key)
+            self.link(key, cell_range)
+
+    def move_many(self, keys, boxes):
+        for key, box in zip(keys, boxes):
+            self.move(key, box)
+
+    def clear(self):
+        self.cells = {}
+        self.boxes = {}
+        self.ranges = {}
+
+    def query(self, box, kind=None):
+        # keys of every box overlapping this one, sorted so callers handle
+        # them in a stable order
+        found = set()
+        for cell in self.range_cells(self.cell_range(box)):
+            bucket = self.cells.get(cell)
+            if bucket:
+                found.update(bucket)
+        return sorted(
+            key
+            for key in found
+            if (kind is None or key[0] == kind) and overlaps(self.boxes[key], box)
+        )
+
+    def pairs(self):
+        # every overlapping pair of registered boxes once, as sorted (a, b)
+        found = set()
+        for bucket in self.cells.values():
+            keys = sorted(bucket)
+            for i, a in enumerate(keys):
+                for b in keys[i + 1 :]:
+                    if (a, b) not in found and overlaps(self.boxes[a], self.boxes[b]):
+                        found.add((a, b))
+        return sorted(found)
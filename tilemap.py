@@ -1,7 +1,11 @@
+import itertools
 import json
 
+import numpy as np
 import pygame
 
+from levelfile import LEVEL_EXTENSION, read_level, write_level
+
 AUTOTILE_MAP = {
     tuple(sorted([(1, 0), (0, 1)])): 0,
     tuple(sorted([(1, 0), (0, 1), (-1, 0)])): 1,
@@ -13,6 +17,12 @@ AUTOTILE_MAP = {
     tuple(sorted([(1, 0), (0, -1), (0, 1)])): 7,
     tuple(sorted([(1, 0), (-1, 0), (0, 1), (0, -1)])): 8,
 }
+# same-type neighbours packed into a 4-bit mask; AUTOTILE_TABLE[mask] is the
+# variant for that mask, or -1 where the tile is left alone
+AUTOTILE_BITS = {(1, 0): 1, (-1, 0): 2, (0, -1): 4, (0, 1): 8}
+AUTOTILE_TABLE = np.full(16, -1, dtype=np.int16)
+for neighbors, variant in AUTOTILE_MAP.items():
+    AUTOTILE_TABLE[sum(AUTOTILE_BITS[shift] for shift in neighbors)] = variant
 
 NEIGHBOR_OFFSETS = [
     (-1, 0),
@@ -29,72 +39,651 @@ PHYSICS_TILES = {"grass", "stone"}
 AUTOTILE_TYPES = {"grass", "stone"}
 
 
+CHUNK_SIZE = 8
+# off-grid tiles are bucketed by their top-left corner; queries reach one
+# bucket further left/up so images up to this size are never missed
+OFFGRID_BUCKET_SIZE = 64
+
+
+def cell_key(xs, ys):
+    # packs signed cell coordinates into one int64 so numpy can sort them
+    return (xs.astype(np.int64) << 32) | (ys.astype(np.int64) & 0xFFFFFFFF)
+
+
+def cell_locs(keys):
+    # inverse of cell_key for an array of keys, as (x, y) tuples
+    xs = keys >> 32
+    ys = ((keys & 0xFFFFFFFF) ^ 0x80000000) - 0x80000000
+    return zip(xs.tolist(), ys.tolist())
+
+
+def group_rows(keys):
+    # sorts rows by key into (order, distinct keys, starts, ends), where
+    # order[starts[i]:ends[i]] are the rows holding keys[i] in row order
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    bounds = np.flatnonzero(np.diff(keys)) + 1
+    starts = np.r_[0, bounds] if keys.size else bounds
+    ends = np.r_[bounds, keys.size] if keys.size else bounds
+    return order, keys[starts], starts.tolist(), ends.tolist()
+
+
+class Grid:
+    # dense per-cell layer over the tile bounding box, indexed [x, y]; it
+    # grows in whole chunks when a tile is placed outside the current bounds
+    def __init__(self, dtype, fill=0):
+        self.dtype = dtype
+        self.fill = fill
+        self.clear()
+
+    def clear(self):
+        self.origin = (0, 0)
+        self.data = np.full((0, 0), self.fill, dtype=self.dtype)
+
+    def contains(self, loc):
+        return (
+            0 <= loc[0] - self.origin[0] < self.data.shape[0]
+            and 0 <= loc[1] - self.origin[1] < self.data.shape[1]
+        )
+
+    def grow(self, loc):
+        if self.data.size:
+            left = min(self.origin[0], loc[0])
+            top = min(self.origin[1], loc[1])
+            right = max(self.origin[0] + self.data.shape[0], loc[0] + 1)
+            bottom = max(self.origin[1] + self.data.shape[1], loc[1] + 1)
+            # leave room on the growing side so filling a map is amortised O(1)
+            if left < self.origin[0]:
+                left -= self.data.shape[0] // 2
+            if top < self.origin[1]:
+                top -= self.data.shape[1] // 2
+            if right > self.origin[0] + self.data.shape[0]:
+                right += self.data.shape[0] // 2
+            if bottom > self.origin[1] + self.data.shape[1]:
+                bottom += self.data.shape[1] // 2
+        else:
+            left, top, right, bottom = loc[0], loc[1], loc[0] + 1, loc[1] + 1
+        left = left // CHUNK_SIZE * CHUNK_SIZE
+        top = top // CHUNK_SIZE * CHUNK_SIZE
+        right = -(-right // CHUNK_SIZE) * CHUNK_SIZE
+        bottom = -(-bottom // CHUNK_SIZE) * CHUNK_SIZE
+        data = np.full((right - left, bottom - top), self.fill, dtype=self.dtype)
+        shift = (self.origin[0] - left, self.origin[1] - top)
+        data[
+            shift[0] : shift[0] + self.data.shape[0],
+            shift[1] : shift[1] + self.data.shape[1],
+        ] = self.data
+        self.origin = (left, top)
+        self.data = data
+
+    def assign(self, origin, data):
+        # takes over a whole layer at once, padded out to chunk boundaries
+        # like grow() would leave it
+        left = origin[0] // CHUNK_SIZE * CHUNK_SIZE
+        top = origin[1] // CHUNK_SIZE * CHUNK_SIZE
+        right = -(-(origin[0] + data.shape[0]) // CHUNK_SIZE) * CHUNK_SIZE
+        bottom = -(-(origin[1] + data.shape[1]) // CHUNK_SIZE) * CHUNK_SIZE
+        self.origin = (left, top)
+        self.data = np.full((right - left, bottom - top), self.fill, self.dtype)
+        self.data[
+            origin[0] - left : origin[0] - left + data.shape[0],
+            origin[1] - top : origin[1] - top + data.shape[1],
+        ] = data
+
+    def scatter(self, xs, ys, values):
+        # replaces the layer with one holding values at the cells (xs, ys)
+        if not len(xs):
+            self.clear()
+            return
+        origin = (int(xs.min()), int(ys.min()))
+        data = np.full(
+            (int(xs.max()) - origin[0] + 1, int(ys.max()) - origin[1] + 1),
+            self.fill,
+            self.dtype,
+        )
+        data[xs - origin[0], ys - origin[1]] = values
+        self.assign(origin, data)
+
+    def filled_chunks(self):
+        # chunk locs holding at least one non-fill cell
+        width = self.data.shape[0] // CHUNK_SIZE
+        height = self.data.shape[1] // CHUNK_SIZE
+        filled = (self.data != self.fill).reshape(
+            width, CHUNK_SIZE, height, CHUNK_SIZE
+        )
+        xs, ys = np.nonzero(filled.any(axis=3).any(axis=1))
+        xs += self.origin[0] // CHUNK_SIZE
+        ys += self.origin[1] // CHUNK_SIZE
+        return zip(xs.tolist(), ys.tolist())
+
+    def get(self, loc):
+        if self.contains(loc):
+            return self.data[loc[0] - self.origin[0], loc[1] - self.origin[1]]
+        return self.fill
+
+    def set(self, loc, value):
+        if not self.contains(loc):
+            if value == self.fill:
+                return
+            self.grow(loc)
+        self.data[loc[0] - self.origin[0], loc[1] - self.origin[1]] = value
+
+    def lookup(self, xs, ys):
+        xs = xs - self.origin[0]
+        ys = ys - self.origin[1]
+        inside = (
+            (xs >= 0)
+            & (xs < self.data.shape[0])
+            & (ys >= 0)
+            & (ys < self.data.shape[1])
+        )
+        values = np.full(xs.shape, self.fill, dtype=self.dtype)
+        values[inside] = self.data[xs[inside], ys[inside]]
+        return values
+
+
 class Tilemap:
     def __init__(self, game, tile_size=16):
         self.game = game
         self.tile_size = tile_size
         self.tilemap = {}
-        self.offgrid_tiles = []
+        self.chunks = {}
+        self.chunk_surfaces = {}
+        self.solid = Grid(bool, fill=False)
+        # type ids (0 = empty) and variants (-1 = empty) for the autotiler;
+        # both are set together for every cell, so they always share a shape
+        self.type_ids = {}
+        self.type_names = [None]
+        self.types = Grid(np.int16, fill=0)
+        self.variants = Grid(np.int16, fill=-1)
+        self.offgrid_tiles = {}
+        self.offgrid_ids = {}
+        self.offgrid_buckets = {}
+        self.offgrid_next_id = 0
+        # (type, variant) -> {loc: tile} / {offgrid id: tile}, so extract only
+        # visits matching tiles
+        self.tile_index = {}
+        self.offgrid_index = {}
+        # a binary level is loaded without making tile dicts: grid tiles
+        # stay in the types/variants grids and off-grid tiles in the file's
+        # records until their chunk or bucket is first touched. The unbuilt
+        # indexes keep extract proportional to the number of matches.
+        self.unbuilt_chunks = set()
+        self.unbuilt_index = {}
+        self.offgrid_records = None
+        self.offgrid_record_names = []
+        self.unbuilt_buckets = {}
+        self.unbuilt_offgrid_index = {}
+
+    def chunk_loc(self, loc):
+        return (loc[0] // CHUNK_SIZE, loc[1] // CHUNK_SIZE)
+
+    def get_tile(self, loc):
+        if self.unbuilt_chunks:
+            self.chunk_tiles(self.chunk_loc(loc))
+        return self.tilemap.get(loc)
+
+    def chunk_tiles(self, chunk_loc):
+        if chunk_loc in self.unbuilt_chunks:
+            self.build_chunk(chunk_loc)
+        return self.chunks.get(chunk_loc)
+
+    def build_chunk(self, chunk_loc):
+        self.unbuilt_chunks.discard(chunk_loc)
+        if not self.unbuilt_chunks:
+            self.unbuilt_index = {}
+        # the grids are chunk aligned, so the chunk is a plain slice of them
+        left = chunk_loc[0] * CHUNK_SIZE
+        top = chunk_loc[1] * CHUNK_SIZE
+        x = left - self.types.origin[0]
+        y = top - self.types.origin[1]
+        types = self.types.data[x : x + CHUNK_SIZE, y : y + CHUNK_SIZE]
+        variants = self.variants.data[x : x + CHUNK_SIZE, y : y + CHUNK_SIZE]
+        xs, ys = np.nonzero(types)
+        chunk = {}
+        for x, y, type_id, variant in zip(
+            (xs + left).tolist(),
+            (ys + top).tolist(),
+            types[xs, ys].tolist(),
+            variants[xs, ys].tolist(),
+        ):
+            loc = (x, y)
+            tile_type = self.type_names[type_id]
+            tile = {"type": tile_type, "variant": variant, "pos": [x, y]}
+            self.tilemap[loc] = tile
+            chunk[loc] = tile
+            self.tile_index.setdefault((tile_type, variant), {})[loc] = tile
+        if chunk:
+            self.chunks[chunk_loc] = chunk
+
+    def build_bucket(self, bucket_loc):
+        rows = self.unbuilt_buckets.pop(bucket_loc)
+        if not self.unbuilt_buckets:
+            self.unbuilt_offgrid_index = {}
+        names = self.offgrid_record_names
+        for tile_id, (type_id, variant, integral, x, y) in zip(
+            rows, self.offgrid_records[rows].tolist()
+        ):
+            if integral:
+                x, y = int(x), int(y)
+            tile = {"type": names[type_id - 1], "variant": variant, "pos": [x, y]}
+            self.insert_offgrid(tile_id, tile)
+
+    def build_all(self):
+        for chunk_loc in list(self.unbuilt_chunks):
+            self.build_chunk(chunk_loc)
+        for bucket_loc in list(self.unbuilt_buckets):
+            self.build_bucket(bucket_loc)
+
+    def type_id(self, tile_type):
+        if tile_type not in self.type_ids:
+            self.type_ids[tile_type] = len(self.type_ids) + 1
+            self.type_names.append(tile_type)
+        return self.type_ids[tile_type]
+
+    def set_tile(self, loc, tile_type, variant):
+        loc = (int(loc[0]), int(loc[1]))
+        tile = self.get_tile(loc)
+        if tile and tile["type"] == tile_type and tile["variant"] == variant:
+            return tile
+        if tile:
+            self.unindex_tile(loc, tile)
+        tile = {"type": tile_type, "variant": variant, "pos": [loc[0], loc[1]]}
+        self.tilemap[loc] = tile
+        self.tile_index.setdefault((tile_type, variant), {})[loc] = tile
+        chunk_loc = self.chunk_loc(loc)
+        self.chunks.setdefault(chunk_loc, {})[loc] = tile
+        self.chunk_surfaces.pop(chunk_loc, None)
+        self.solid.set(loc, tile_type in PHYSICS_TILES)
+        self.types.set(loc, self.type_id(tile_type))
+        self.variants.set(loc, variant)
+        return tile
+
+    def remove_tile(self, loc):
+        tile = self.get_tile(loc)
+        if tile:
+            del self.tilemap[loc]
+            self.unindex_tile(loc, tile)
+            chunk_loc = self.chunk_loc(loc)
+            chunk = self.chunks[chunk_loc]
+            del chunk[loc]
+            if not chunk:
+                del self.chunks[chunk_loc]
+            self.chunk_surfaces.pop(chunk_loc, None)
+            self.erase_cell(loc)
+        return tile
+
+    def erase_cell(self, loc):
+        self.solid.set(loc, False)
+        self.types.set(loc, 0)
+        self.variants.set(loc, -1)
+
+    def set_variant(self, loc, variant):
+        tile = self.get_tile(loc)
+        if tile["variant"] == variant:
+            return
+        self.unindex_tile(loc, tile)
+        tile["variant"] = variant
+        self.tile_index.setdefault((tile["type"], variant), {})[loc] = tile
+        self.variants.set(loc, variant)
+        self.chunk_surfaces.pop(self.chunk_loc(loc), None)
+
+    def unindex_tile(self, loc, tile):
+        key = (tile["type"], tile["variant"])
+        bucket = self.tile_index[key]
+        del bucket[loc]
+        if not bucket:
+            del self.tile_index[key]
+
+    def clear(self):
+        self.tilemap = {}
+        self.chunks = {}
+        self.chunk_surfaces = {}
+        self.solid.clear()
+        self.types.clear()
+        self.variants.clear()
+        self.offgrid_tiles = {}
+        self.offgrid_ids = {}
+        self.offgrid_buckets = {}
+        self.tile_index = {}
+        self.offgrid_index = {}
+        self.unbuilt_chunks = set()
+        self.unbuilt_index = {}
+        self.offgrid_records = None
+        self.offgrid_record_names = []
+        self.unbuilt_buckets = {}
+        self.unbuilt_offgrid_index = {}
+
+    def bucket_loc(self, pos):
+        return (
+            int(pos[0] // OFFGRID_BUCKET_SIZE),
+            int(pos[1] // OFFGRID_BUCKET_SIZE),
+        )
+
+    def add_offgrid(self, tile_type, variant, pos):
+        tile = {"type": tile_type, "variant": variant, "pos": [pos[0], pos[1]]}
+        tile_id = self.offgrid_next_id
+        self.offgrid_next_id += 1
+        self.insert_offgrid(tile_id, tile)
+        return tile
+
+    def insert_offgrid(self, tile_id, tile):
+        bucket_loc = self.bucket_loc(tile["pos"])
+        self.offgrid_tiles[tile_id] = tile
+        self.offgrid_ids[id(tile)] = tile_id
+        self.offgrid_buckets.setdefault(bucket_loc, {})[tile_id] = tile
+        key = (tile["type"], tile["variant"])
+        self.offgrid_index.setdefault(key, {})[tile_id] = tile
+
+    def remove_offgrid(self, tile):
+        tile_id = self.offgrid_ids.pop(id(tile))
+        del self.offgrid_tiles[tile_id]
+        bucket_loc = self.bucket_loc(tile["pos"])
+        bucket = self.offgrid_buckets[bucket_loc]
+        del bucket[tile_id]
+        if not bucket:
+            del self.offgrid_buckets[bucket_loc]
+        key = (tile["type"], tile["variant"])
+        del self.offgrid_index[key][tile_id]
+        if not self.offgrid_index[key]:
+            del self.offgrid_index[key]
+
+    def offgrid_in_rect(self, rect):
+        # candidates whose top-left lies within one bucket of the rect, in
+        # placement order so overlapping decor keeps its draw order
+        left = int(rect[0] // OFFGRID_BUCKET_SIZE) - 1
+        top = int(rect[1] // OFFGRID_BUCKET_SIZE) - 1
+        right = int((rect[0] + rect[2]) // OFFGRID_BUCKET_SIZE)
+        bottom = int((rect[1] + rect[3]) // OFFGRID_BUCKET_SIZE)
+        found = []
+        for bucket_x in range(left, right + 1):
+            for bucket_y in range(top, bottom + 1):
+                if (bucket_x, bucket_y) in self.unbuilt_buckets:
+                    self.build_bucket((bucket_x, bucket_y))
+                bucket = self.offgrid_buckets.get((bucket_x, bucket_y))
+                if bucket:
+                    found.extend(bucket.items())
+        found.sort(key=lambda item: item[0])
+        return [tile for tile_id, tile in found]
 
     def extract(self, id_pairs, keep=False):
+        id_pairs = list(dict.fromkeys(id_pairs))
+        # off-grid matches keep their placement order across pairs. Matches
+        # that were never built are copied straight from the level data and,
+        # unless kept, dropped from it, so extracting builds no chunks.
+        offgrid = []
+        unbuilt_offgrid = []
+        for pair in id_pairs:
+            offgrid.extend(self.offgrid_index.get(pair, {}).items())
+            rows = self.unbuilt_offgrid_index.get(pair)
+            if rows is None:
+                continue
+            if not keep:
+                del self.unbuilt_offgrid_index[pair]
+            records = self.offgrid_records[rows]
+            bucket_keys = cell_key(
+                np.floor_divide(records["x"], OFFGRID_BUCKET_SIZE),
+                np.floor_divide(records["y"], OFFGRID_BUCKET_SIZE),
+            )
+            for tile_id, bucket_loc, (_, _, integral, x, y) in zip(
+                rows.tolist(), cell_locs(bucket_keys), records.tolist()
+            ):
+                if bucket_loc not in self.unbuilt_buckets:
+                    continue
+                if integral:
+                    x, y = int(x), int(y)
+                tile = {"type": pair[0], "variant": pair[1], "pos": [x, y]}
+                offgrid.append((tile_id, tile))
+                unbuilt_offgrid.append((tile_id, bucket_loc))
+        offgrid.sort(key=lambda item: item[0])
+        if not keep:
+            for tile_id, bucket_loc in unbuilt_offgrid:
+                rows = self.unbuilt_buckets[bucket_loc]
+                rows.remove(tile_id)
+                if not rows:
+                    del self.unbuilt_buckets[bucket_loc]
+            if not self.unbuilt_buckets:
+                self.unbuilt_offgrid_index = {}
+
+        grid = []
+        for pair in id_pairs:
+            grid.extend(self.tile_index.get(pair, {}).items())
+            cells = self.unbuilt_index.get(pair)
+            if cells is None:
+                continue
+            if not keep:
+                del self.unbuilt_index[pair]
+            for x, y in zip(cells[0].tolist(), cells[1].tolist()):
+                if (x // CHUNK_SIZE, y // CHUNK_SIZE) in self.unbuilt_chunks:
+                    tile = {"type": pair[0], "variant": pair[1], "pos": [x, y]}
+                    grid.append(((x, y), tile))
+        # map order, whichever chunks happen to be built
+        grid.sort(key=lambda item: item[0])
+
         matches = []
-        for tile in self.offgrid_tiles.copy():
-            if (tile["type"], tile["variant"]) in id_pairs:
-                matches.append(tile.copy())
-                if not keep:
-                    self.offgrid_tiles.remove(tile)
-        for loc in self.tilemap.copy():
-            tile = self.tilemap[loc]
-            if (tile["type"], tile["variant"]) in id_pairs:
-                matches.append(tile.copy())
-                matches[-1]["pos"] = matches[-1]["pos"].copy()
-                matches[-1]["pos"][0] *= self.tile_size
-                matches[-1]["pos"][1] *= self.tile_size
-                if not keep:
-                    del self.tilemap[loc]
+        for tile_id, tile in offgrid:
+            matches.append(tile.copy())
+            if not keep and tile_id in self.offgrid_tiles:
+                self.remove_offgrid(tile)
+        for loc, tile in grid:
+            matches.append(tile.copy())
+            matches[-1]["pos"] = matches[-1]["pos"].copy()
+            matches[-1]["pos"][0] *= self.tile_size
+            matches[-1]["pos"][1] *= self.tile_size
+            if keep:
+                continue
+            if loc in self.tilemap:
+                self.remove_tile(loc)
+            else:
+                self.erase_cell(loc)
         return matches
 
+    def tile_at(self, pos):
+        return self.get_tile(
+            (int(pos[0] // self.tile_size), int(pos[1] // self.tile_size))
+        )
+
     def tiles_around(self, pos):
         tiles = []
-        tile_loc = (int(pos[0] // self.tile_size), int(pos[1] // self.tile_size))
+        tile_x = int(pos[0] // self.tile_size)
+        tile_y = int(pos[1] // self.tile_size)
+        if self.unbuilt_chunks:
+            # the 3x3 block spans at most the chunks of its four corners
+            for dx, dy in ((-1, -1), (1, -1), (-1, 1), (1, 1)):
+                self.chunk_tiles(self.chunk_loc((tile_x + dx, tile_y + dy)))
+        tilemap = self.tilemap
         for offset in NEIGHBOR_OFFSETS:
-            check_loc = (
-                str(tile_loc[0] + offset[0]) + ";" + str(tile_loc[1] + offset[1])
-            )
-            if check_loc in self.tilemap:
-                tiles.append(self.tilemap[check_loc])
+            tile = tilemap.get((tile_x + offset[0], tile_y + offset[1]))
+            if tile:
+                tiles.append(tile)
         return tiles
 
-    def save(self, path):
+    def tiles_in_rect(self, rect):
+        left = int(rect[0] // self.tile_size)
+        top = int(rect[1] // self.tile_size)
+        right = int((rect[0] + rect[2] - 1) // self.tile_size)
+        bottom = int((rect[1] + rect[3] - 1) // self.tile_size)
+        tiles = []
+        for chunk_x in range(left // CHUNK_SIZE, right // CHUNK_SIZE + 1):
+            for chunk_y in range(top // CHUNK_SIZE, bottom // CHUNK_SIZE + 1):
+                chunk = self.chunk_tiles((chunk_x, chunk_y))
+                if not chunk:
+                    continue
+                for loc, tile in chunk.items():
+                    if left <= loc[0] <= right and top <= loc[1] <= bottom:
+                        tiles.append(tile)
+        return tiles
+
+    def save(self, path, binary=None):
+        if binary is None:
+            binary = path.endswith(LEVEL_EXTENSION)
+        self.build_all()
+        if binary:
+            write_level(
+                path,
+                self.tile_size,
+                list(self.tilemap.values()),
+                self.offgrid_in_order(),
+            )
+            return
+
         f = open(path, "w")
         json.dump(
             {
-                "tilemap": self.tilemap,
+                "tilemap": {
+                    str(loc[0]) + ";" + str(loc[1]): tile
+                    for loc, tile in self.tilemap.items()
+                },
                 "tile_size": self.tile_size,
-                "offgrid": self.offgrid_tiles,
+                "offgrid": self.offgrid_in_order(),
             },
             f,
         )
         f.close()
 
+    def offgrid_in_order(self):
+        return [self.offgrid_tiles[tile_id] for tile_id in sorted(self.offgrid_tiles)]
+
     def load(self, path):
+        if path.endswith(LEVEL_EXTENSION):
+            self.load_level_data(read_level(path))
+            return
+
         f = open(path, "r")
         map_data = json.load(f)
         f.close()
 
-        self.tilemap = map_data["tilemap"]
+        self.load_map_data(map_data)
+
+    def load_map_data(self, map_data):
+        # the parsed dicts become the tiles in one pass; the grids are then
+        # filled in bulk rather than cell by cell through set_tile
+        self.clear()
         self.tile_size = map_data["tile_size"]
-        self.offgrid_tiles = map_data["offgrid"]
+        tilemap = self.tilemap
+        chunks = self.chunks
+        tile_index = self.tile_index
+        for tile in map_data["tilemap"].values():
+            loc = tuple(tile["pos"])
+            tilemap[loc] = tile
+            chunk_loc = (loc[0] // CHUNK_SIZE, loc[1] // CHUNK_SIZE)
+            chunk = chunks.get(chunk_loc)
+            if chunk is None:
+                chunk = chunks[chunk_loc] = {}
+            chunk[loc] = tile
+            key = (tile["type"], tile["variant"])
+            bucket = tile_index.get(key)
+            if bucket is None:
+                bucket = tile_index[key] = {}
+            bucket[loc] = tile
+        self.fill_grids()
 
-    def solid_check(self, pos):
-        tile_loc = (
-            str(int(pos[0] // self.tile_size))
-            + ";"
-            + str(int(pos[1] // self.tile_size))
+        for tile_id, tile in enumerate(map_data["offgrid"]):
+            self.insert_offgrid(tile_id, tile)
+        self.offgrid_next_id = len(map_data["offgrid"])
+
+    def fill_grids(self):
+        # solid/types/variants for every tile at once, one array per index
+        # bucket instead of one write per cell
+        cells = [np.zeros((0, 2), np.int64)]
+        type_ids = [np.zeros(0, np.int16)]
+        variants = [np.zeros(0, np.int16)]
+        for (tile_type, variant), bucket in self.tile_index.items():
+            coords = itertools.chain.from_iterable(bucket)
+            cells.append(np.fromiter(coords, np.int64, len(bucket) * 2).reshape(-1, 2))
+            type_ids.append(np.full(len(bucket), self.type_id(tile_type), np.int16))
+            variants.append(np.full(len(bucket), variant, np.int16))
+        cells = np.concatenate(cells)
+        type_ids = np.concatenate(type_ids)
+        solid = np.array([name in PHYSICS_TILES for name in self.type_names])
+        self.types.scatter(cells[:, 0], cells[:, 1], type_ids)
+        self.variants.scatter(cells[:, 0], cells[:, 1], np.concatenate(variants))
+        self.solid.scatter(cells[:, 0], cells[:, 1], solid[type_ids])
+
+    def load_level_data(self, level):
+        # the packed grids become the tile layers as they are and no tile
+        # dicts are made here (see build_chunk/build_bucket), so the load is
+        # a handful of numpy passes however large the level is
+        self.clear()
+        self.tile_size = level.tile_size
+
+        names = level.type_names
+        type_ids = np.array([0] + [self.type_id(name) for name in names], np.int16)
+        solid = np.array([False] + [name in PHYSICS_TILES for name in names])
+        self.types.assign(level.origin, np.take(type_ids, level.types))
+        self.solid.assign(level.origin, np.take(solid, level.types))
+        variants = level.variants.astype(np.int16)
+        variants[level.types == 0] = -1
+        self.variants.assign(level.origin, variants)
+        self.unbuilt_chunks = set(self.types.filled_chunks())
+
+        cells = np.flatnonzero(level.types)
+        height = level.types.shape[1]
+        xs = cells // height + level.origin[0]
+        ys = cells % height + level.origin[1]
+        pairs = level.types.ravel()[cells].astype(np.uint16) << 8
+        pairs |= level.variants.ravel()[cells]
+        order, keys, starts, ends = group_rows(pairs)
+        xs = xs[order]
+        ys = ys[order]
+        for key, start, end in zip(keys.tolist(), starts, ends):
+            pair = (names[(key >> 8) - 1], key & 0xFF)
+            self.unbuilt_index[pair] = (xs[start:end], ys[start:end])
+
+        records = np.array(level.offgrid)
+        self.offgrid_records = records
+        self.offgrid_record_names = names
+        self.offgrid_next_id = len(records)
+        pairs = records["type"].astype(np.uint16) << 8 | records["variant"]
+        order, keys, starts, ends = group_rows(pairs)
+        for key, start, end in zip(keys.tolist(), starts, ends):
+            pair = (names[(key >> 8) - 1], key & 0xFF)
+            self.unbuilt_offgrid_index[pair] = order[start:end]
+        bucket_keys = cell_key(
+            np.floor_divide(records["x"], OFFGRID_BUCKET_SIZE),
+            np.floor_divide(records["y"], OFFGRID_BUCKET_SIZE),
         )
-        if tile_loc in self.tilemap:
-            if self.tilemap[tile_loc]["type"] in PHYSICS_TILES:
-                return self.tilemap[tile_loc]
+        order, keys, starts, ends = group_rows(bucket_keys)
+        order = order.tolist()
+        self.unbuilt_buckets = {
+            loc: order[start:end]
+            for loc, start, end in zip(cell_locs(keys), starts, ends)
+        }
+
+    def solid_check(self, pos):
+        tile = self.tile_at(pos)
+        if tile and tile["type"] in PHYSICS_TILES:
+            return tile
+
+    def solid_check_many(self, points):
+        points = np.floor_divide(points, self.tile_size).astype(np.int64)
+        return self.solid.lookup(points[:, 0], points[:, 1])
+
+    def sweep(self, pos, size, axis, delta):
+        # moves a box (truncated to whole pixels, like a Rect) by delta along
+        # axis 0 (x) or 1 (y) against the solid grid. Every cell line the
+        # leading edge crosses is checked, so moves longer than a tile cannot
+        # tunnel. Returns the new coordinate and whether a wall stopped it.
+        ts = self.tile_size
+        across = 1 - axis
+        start = int(pos[axis])
+        end = int(pos[axis] + delta)
+        first = int(pos[across]) // ts
+        last = (int(pos[across]) + size[across] - 1) // ts
+        if delta > 0:
+            cells = range(
+                (start + size[axis] - 1) // ts, (end + size[axis] - 1) // ts + 1
+            )
+        else:
+            cells = range(start // ts, end // ts - 1, -1)
+        solid = self.solid
+        for cell in cells:
+            for other in range(first, last + 1):
+                if solid.get((cell, other) if axis == 0 else (other, cell)):
+                    if delta > 0:
+                        return cell * ts - size[axis], True
+                    return (cell + 1) * ts, True
+        return pos[axis] + delta, False
 
     def physics_rects_around(self, pos):
         rects = []
@@ -111,44 +700,111 @@ class Tilemap:
         return rects
 
     def autotile(self):
-        for loc in self.tilemap:
-            tile = self.tilemap[loc]
-            neighbors = set()
-            for shift in [(1, 0), (-1, 0), (0, -1), (0, 1)]:
-                check_loc = (
-                    str(tile["pos"][0] + shift[0])
-                    + ";"
-                    + str(tile["pos"][1] + shift[1])
-                )
-                if check_loc in self.tilemap:
-                    if self.tilemap[check_loc]["type"] == tile["type"]:
-                        neighbors.add(shift)
-            neighbors = tuple(sorted(neighbors))
-            if (tile["type"] in AUTOTILE_TYPES) and (neighbors in AUTOTILE_MAP):
-                tile["variant"] = AUTOTILE_MAP[neighbors]
+        # whole-map pass: neighbour masks for every cell at once, then only
+        # the tiles whose variant actually changes are touched
+        types = self.types.data
+        if not types.size:
+            return
+        padded = np.pad(types, 1)
+        center = padded[1:-1, 1:-1]
+        masks = (
+            (padded[2:, 1:-1] == center) * AUTOTILE_BITS[(1, 0)]
+            | (padded[:-2, 1:-1] == center) * AUTOTILE_BITS[(-1, 0)]
+            | (padded[1:-1, :-2] == center) * AUTOTILE_BITS[(0, -1)]
+            | (padded[1:-1, 2:] == center) * AUTOTILE_BITS[(0, 1)]
+        )
+        variants = AUTOTILE_TABLE[masks]
+        autotile_ids = [self.type_id(tile_type) for tile_type in AUTOTILE_TYPES]
+        changed = (
+            np.isin(center, autotile_ids)
+            & (variants >= 0)
+            & (variants != self.variants.data)
+        )
+        xs, ys = np.nonzero(changed)
+        for x, y, variant in zip(
+            (xs + self.types.origin[0]).tolist(),
+            (ys + self.types.origin[1]).tolist(),
+            variants[xs, ys].tolist(),
+        ):
+            self.set_variant((x, y), variant)
+
+    def autotile_cell(self, loc):
+        tile = self.get_tile(loc)
+        if not tile or tile["type"] not in AUTOTILE_TYPES:
+            return
+        type_id = self.types.get(loc)
+        mask = 0
+        for shift, bit in AUTOTILE_BITS.items():
+            if self.types.get((loc[0] + shift[0], loc[1] + shift[1])) == type_id:
+                mask |= bit
+        variant = AUTOTILE_TABLE[mask]
+        if variant >= 0:
+            self.set_variant(loc, int(variant))
+
+    def autotile_around(self, loc):
+        # incremental pass after an edit: only the cell and its neighbours
+        # can have changed masks
+        self.autotile_cell(loc)
+        for shift in AUTOTILE_BITS:
+            self.autotile_cell((loc[0] + shift[0], loc[1] + shift[1]))
+
+    def bake_chunk(self, chunk_loc):
+        # grid tiles never move during play, so each chunk is composited once
+        # and reused until set_tile/remove_tile/autotile touches it
+        chunk = self.chunks[chunk_loc]
+        chunk_px = CHUNK_SIZE * self.tile_size
+        pad = 0
+        for tile in chunk.values():
+            img = self.game.assets[tile["type"]][tile["variant"]]
+            pad = max(
+                pad,
+                img.get_width() - self.tile_size,
+                img.get_height() - self.tile_size,
+            )
+        surf = pygame.Surface((chunk_px + pad, chunk_px + pad))
+        surf.fill((0, 0, 0))
+        surf.set_colorkey((0, 0, 0))
+        origin = (chunk_loc[0] * chunk_px, chunk_loc[1] * chunk_px)
+        for loc in sorted(chunk):
+            tile = chunk[loc]
+            surf.blit(
+                self.game.assets[tile["type"]][tile["variant"]],
+                (
+                    loc[0] * self.tile_size - origin[0],
+                    loc[1] * self.tile_size - origin[1],
+                ),
+            )
+        self.chunk_surfaces[chunk_loc] = surf
+        return surf
 
     def render(self, surf, offset=(0, 0)):
-        for tile in self.offgrid_tiles:
+        for tile in self.offgrid_in_rect(
+            (offset[0], offset[1], surf.get_width(), surf.get_height())
+        ):
             surf.blit(
                 self.game.assets[tile["type"]][tile["variant"]],
                 (tile["pos"][0] - offset[0], tile["pos"][1] - offset[1]),
             )
 
-        for x in range(
-            offset[0] // self.tile_size,
-            (offset[0] + surf.get_width()) // self.tile_size + 1,
+        # start one chunk early so tiles overhanging from the left/top show up
+        chunk_px = CHUNK_SIZE * self.tile_size
+        for chunk_x in range(
+            offset[0] // chunk_px - 1,
+            (offset[0] + surf.get_width()) // chunk_px + 1,
         ):
-            for y in range(
-                offset[1] // self.tile_size,
-                (offset[1] + surf.get_height()) // self.tile_size + 1,
+            for chunk_y in range(
+                offset[1] // chunk_px - 1,
+                (offset[1] + surf.get_height()) // chunk_px + 1,
             ):
-                loc = str(x) + ";" + str(y)
-                if loc in self.tilemap:
-                    tile = self.tilemap[loc]
+                chunk_loc = (chunk_x, chunk_y)
+                if self.chunk_tiles(chunk_loc):
+                    chunk_surf = self.chunk_surfaces.get(chunk_loc)
+                    if not chunk_surf:
+                        chunk_surf = self.bake_chunk(chunk_loc)
                     surf.blit(
-                        self.game.assets[tile["type"]][tile["variant"]],
+                        chunk_surf,
                         (
-                            tile["pos"][0] * self.tile_size - offset[0],
-                            tile["pos"][1] * self.tile_size - offset[1],
+                            chunk_x * chunk_px - offset[0],
+                            chunk_y * chunk_px - offset[1],
                         ),
                     )
@@ -1,13 +1,22 @@
 import os
+import sys
 
 import pygame
 
 BASE_IMG_PATH = "images/"
+# the browser build has no threads, so background loaders fall back to
+# doing their work in place there
+THREADED = sys.platform != "emscripten"
+
+# filled by assets.AssetLoader.preload; keyed by path relative to images/
+preloaded_images = {}
 
 
 def load_image(path):
-    img = pygame.image.load(BASE_IMG_PATH + path).convert()
-    img.set_colorkey((0, 0, 0))
+    img = preloaded_images.get(path)
+    if img is None:
+        img = pygame.image.load(BASE_IMG_PATH + path).convert()
+        img.set_colorkey((0, 0, 0))
     return img
 
 
@@ -18,16 +27,23 @@ def load_images(path):
     return images
 
 
+def flip_x(img):
+    return pygame.transform.flip(img, True, False)
+
+
 class Animation:
-    def __init__(self, images, img_dur=5, loop=True):
+    def __init__(self, images, img_dur=5, loop=True, transforms=None):
         self.images = images
         self.loop = loop
         self.img_duration = img_dur
         self.done = False
         self.frame = 0
+        # transformed frame lists, shared by every copy of this animation so
+        # each transform runs once per image list rather than once per frame
+        self.transforms = {} if transforms is None else transforms
 
     def copy(self):
-        return Animation(self.images, self.img_duration, self.loop)
+        return Animation(self.images, self.img_duration, self.loop, self.transforms)
 
     def update(self):
         if self.loop:
@@ -37,5 +53,18 @@ class Animation:
             if self.frame >= self.img_duration * len(self.images) - 1:
                 self.done = True
 
-    def img(self):
+    def transformed_frames(self, key, transform):
+        frames = self.transforms.get(key)
+        if frames is None:
+            frames = [transform(img) for img in self.images]
+            self.transforms[key] = frames
+        return frames
+
+    def transformed(self, key, transform):
+        frames = self.transformed_frames(key, transform)
+        return frames[int(self.frame / self.img_duration)]
+
+    def img(self, flip=False):
+        if flip:
+            return self.transformed("flip", flip_x)
         return self.images[int(self.frame / self.img_duration)]